@@ -1,82 +1,86 @@
-from fastapi import FastAPI, HTTPException
+import os
+import asyncio
+import logging
+import orjson
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
-from typing import Union, Literal, Optional, List
-from services.narrative_service import generate_narrative
-
-app = FastAPI(title="Unified Narrative API", version="1.0")
-
-# Configure CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["http://localhost:3000"],  # Replace with your frontend's origin as needed
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+from fastapi.middleware.gzip import GZipMiddleware
+from pydantic import BaseModel
+from models.narrative import (
+    NarrativeRequest,
+    NarrativeResponse,
+    InitialNarrativeRequest,
+    RoundNarrativeRequest,
+    FinalNarrativeRequest,
 )
+from services.gemini_service import GeminiAPIError, warm_up
+from services.narrative_service import generate_narrative_async, generate_narrative_stream, preload
+from utils.parser import NarrativeFormatError
 
-# ============================
-# REQUEST MODELS
-# ============================
+logger = logging.getLogger(__name__)
 
-class BaseNarrativeRequest(BaseModel):
-    stage: str
-    language: str  # Now required
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Warms up the Gemini client and preloads the narrative service before the first request is accepted.
 
-class InitialNarrativeRequest(BaseNarrativeRequest):
-    stage: Literal['initial'] = 'initial'
-    # No additional parameters required for the initial stage.
+    Both run concurrently. A failed warm-up is logged and not fatal; the first request
+    then pays the setup cost.
+    """
+    results = await asyncio.gather(warm_up(), asyncio.to_thread(preload), return_exceptions=True)
+    for name, result in zip(("Gemini client", "Narrative service"), results):
+        if isinstance(result, Exception):
+            logger.warning("%s warm-up failed", name, exc_info=result)
+    yield
 
-class RoundNarrativeRequest(BaseNarrativeRequest):
-    stage: Literal['round'] = 'round'
-    narrative_context: Optional[str] = ""
-    action: Optional[str] = ""
-    outcome_value: int = 0
-    action_confirming_sentence: Optional[str] = ""
+app = FastAPI(title="Unified Narrative API", version="1.0", lifespan=lifespan)
 
-class FinalNarrativeRequest(BaseNarrativeRequest):
-    stage: Literal['final'] = 'final'
-    narrative_context: str
-    win_or_loss: str = Field(..., pattern="^(?i)(win|loss)$")  # Accepts "win" or "loss"
+# Compress larger JSON bodies (narrative text can run to several KB).
+app.add_middleware(GZipMiddleware, minimum_size=500)
 
-# Unified request model as a discriminated union:
-NarrativeRequest = Union[InitialNarrativeRequest, RoundNarrativeRequest, FinalNarrativeRequest]
+# Configure CORS middleware. Added last so it is the outermost layer and answers
+# preflight requests before anything else runs.
+app.add_middleware(
+    CORSMiddleware,
+    # Comma-separated list of allowed frontend origins.
+    allow_origins=os.environ.get("CORS_ORIGINS", "http://localhost:3000").split(","),
+    allow_credentials=True,
+    allow_methods=["GET", "POST"],
+    allow_headers=["Content-Type", "Authorization"],
+)
 
 # ============================
-# RESPONSE MODELS
+# ERROR HANDLERS
 # ============================
 
-class Choice(BaseModel):
-    id: int
-    choice_description: str
-    confirming_sentence: str
-    outcome: str
-
-class InitialNarrativeResponse(BaseModel):
-    stage: Literal['initial'] = 'initial'
-    situation: str
-    choices: List[Choice]
-
-class RoundNarrativeResponse(BaseModel):
-    stage: Literal['round'] = 'round'
-    confirming_sentence: str
-    situation: str
-    choices: List[Choice]
+@app.exception_handler(GeminiAPIError)
+async def gemini_api_error_handler(request: Request, exc: GeminiAPIError):
+    logger.exception("Gemini API request failed", exc_info=exc)
+    return JSONResponse(status_code=502, content={"detail": "Narrative generation failed upstream."})
 
-class FinalNarrativeResponse(BaseModel):
-    stage: Literal['final'] = 'final'
-    confirming_sentence: str
-    situation: str
-
-# Unified response type:
-NarrativeResponse = Union[InitialNarrativeResponse, RoundNarrativeResponse, FinalNarrativeResponse]
+@app.exception_handler(NarrativeFormatError)
+async def narrative_format_error_handler(request: Request, exc: NarrativeFormatError):
+    logger.exception("Gemini returned a malformed narrative", exc_info=exc)
+    return JSONResponse(status_code=502, content={"detail": "Narrative response format invalid."})
 
 # ============================
 # UNIFIED ENDPOINT
 # ============================
 
+def narrative_response(result: BaseModel) -> Response:
+    """
+    Serializes a narrative response model from the narrative service.
+
+    The service has already validated the result into its response model, so it is
+    dumped straight to JSON by pydantic-core. Returning a Response skips FastAPI's
+    response_model re-validation; response_model stays on the route for the OpenAPI docs.
+    """
+    return Response(content=result.model_dump_json(), media_type="application/json")
+
 @app.post("/api/narrative", response_model=NarrativeResponse)
-def unified_narrative_endpoint(request: NarrativeRequest):
+async def unified_narrative_endpoint(request: NarrativeRequest):
     """
     Unified Narrative Endpoint
 
@@ -86,45 +90,95 @@ def unified_narrative_endpoint(request: NarrativeRequest):
       - "final": Requires narrative_context and win_or_loss.
 
     **Every** request must include the "language" parameter.
+
+    Gemini failures and malformed Gemini output are answered with 502 by the error
+    handlers above; request validation errors with FastAPI's standard 422.
+
+    The Gemini call takes several seconds and is awaited through the async client,
+    so the event loop keeps serving other requests meanwhile.
+    """
+    if request.stage == "initial":
+        req: InitialNarrativeRequest = request
+        logger.debug("request=%s", req)
+        result = await generate_narrative_async(
+            stage="initial",
+            language=req.language
+        )
+        return narrative_response(result)
+
+    elif request.stage == "round":
+        req: RoundNarrativeRequest = request
+        logger.debug("request=%s", req)
+        result = await generate_narrative_async(
+            stage="round",
+            narrative_context=req.narrative_context,
+            action=req.action,
+            outcome_value=req.outcome_value,
+            action_confirming_sentence=req.action_confirming_sentence,
+            language=req.language
+        )
+        return narrative_response(result)
+
+    elif request.stage == "final":
+        req: FinalNarrativeRequest = request
+        logger.debug("request=%s", req)
+        result = await generate_narrative_async(
+            stage="final",
+            narrative_context=req.narrative_context,
+            win_or_loss=req.win_or_loss,
+            language=req.language
+        )
+        return narrative_response(result)
+
+
+# ============================
+# STREAMING ENDPOINT
+# ============================
+
+@app.post("/api/narrative/stream")
+async def narrative_stream_endpoint(request: NarrativeRequest):
+    """
+    Streaming Narrative Endpoint
+
+    Accepts the same payload as /api/narrative but streams the answer as NDJSON
+    (one JSON object per line) while Gemini is still generating:
+      - {"section": "SITUATION", "text": "..."} for every section as soon as it is complete
+        (labels as in the prompt format: CONFIRMING SENTENCE, SITUATION, ACTION 1, ...).
+      - {"result": {...}} last, holding the same object /api/narrative returns.
+      - {"error": "..."} instead of the result if Gemini fails or the response could not be parsed
+        (the status code is already sent once streaming starts).
     """
-    try:
-        if request.stage == "initial":
-            req: InitialNarrativeRequest = request
-            print(req)
-            result = generate_narrative(
-                stage="initial",
-                language=req.language
-            )
-            result["stage"] = "initial"
-            return result
-
-        elif request.stage == "round":
-            req: RoundNarrativeRequest = request
-            print(req)
-            result = generate_narrative(
-                stage="round",
-                narrative_context=req.narrative_context,
-                action=req.action,
-                outcome_value=req.outcome_value,
-                action_confirming_sentence=req.action_confirming_sentence,
-                language=req.language
-            )
-            result["stage"] = "round"
-            return result
-
-        elif request.stage == "final":
-            req: FinalNarrativeRequest = request
-            print(req)
-            result = generate_narrative(
-                stage="final",
-                narrative_context=req.narrative_context,
-                win_or_loss=req.win_or_loss,
-                language=req.language
-            )
-            result["stage"] = "final"
-            return result
-
-        else:
-            raise HTTPException(status_code=400, detail="Invalid stage provided.")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+    logger.debug("request=%s", request)
+
+    async def events():
+        try:
+            async for event in generate_narrative_stream(**request.model_dump()):
+                if event[0] == "section":
+                    _, label, text = event
+                    line = {"section": label, "text": text}
+                else:
+                    line = {"result": event[1].model_dump()}
+                yield orjson.dumps(line) + b"\n"
+        except GeminiAPIError:
+            logger.exception("Gemini API request failed")
+            yield orjson.dumps({"error": "Narrative generation failed upstream."}) + b"\n"
+        except NarrativeFormatError:
+            logger.exception("Gemini returned a malformed narrative")
+            yield orjson.dumps({"error": "Narrative response format invalid."}) + b"\n"
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(
+        "app:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="uvloop",
+        http="httptools",
+        workers=int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1)),
+        limit_concurrency=1000,
+        timeout_keep_alive=30,
+    )
@@ -0,0 +1,120 @@
+# ./backend/models/narrative.py
+"""
+Request and response models for the unified narrative API.
+"""
+from pydantic import BaseModel, ConfigDict, Field, field_validator
+from typing import Annotated, Union, Literal, Optional, List
+
+# Shared by every model: drop unknown fields instead of storing or rejecting them,
+# never re-validate model instances passed through, and do no extra per-field work.
+MODEL_CONFIG = ConfigDict(
+    extra="ignore",
+    revalidate_instances="never",
+    str_strip_whitespace=False,
+    validate_assignment=False,
+)
+
+# ============================
+# REQUEST MODELS
+# ============================
+
+class BaseNarrativeRequest(BaseModel):
+    model_config = MODEL_CONFIG
+
+    stage: str
+    language: str  # Now required
+
+class InitialNarrativeRequest(BaseNarrativeRequest):
+    stage: Literal['initial'] = 'initial'
+    # No additional parameters required for the initial stage.
+
+class RoundNarrativeRequest(BaseNarrativeRequest):
+    stage: Literal['round'] = 'round'
+    narrative_context: Optional[str] = ""
+    action: Optional[str] = ""
+    outcome_value: int = 0
+    action_confirming_sentence: Optional[str] = ""
+
+class FinalNarrativeRequest(BaseNarrativeRequest):
+    stage: Literal['final'] = 'final'
+    narrative_context: str
+    win_or_loss: Literal['win', 'loss']  # Accepts "win" or "loss" (case-insensitive)
+
+    @field_validator("win_or_loss", mode="before")
+    @classmethod
+    def normalize_win_or_loss(cls, value):
+        return value.lower() if isinstance(value, str) else value
+
+# Unified request model as a discriminated union, dispatched on "stage":
+NarrativeRequest = Annotated[
+    Union[InitialNarrativeRequest, RoundNarrativeRequest, FinalNarrativeRequest],
+    Field(discriminator="stage"),
+]
+
+# ============================
+# RESPONSE MODELS
+# ============================
+
+class Choice(BaseModel):
+    model_config = MODEL_CONFIG
+
+    id: int
+    choice_description: str
+    confirming_sentence: str
+    outcome: str
+
+class BaseNarrativeResponse(BaseModel):
+    model_config = MODEL_CONFIG
+
+class InitialNarrativeResponse(BaseNarrativeResponse):
+    stage: Literal['initial'] = 'initial'
+    situation: str
+    choices: List[Choice]
+
+class RoundNarrativeResponse(BaseNarrativeResponse):
+    stage: Literal['round'] = 'round'
+    confirming_sentence: str
+    situation: str
+    choices: List[Choice]
+
+class FinalNarrativeResponse(BaseNarrativeResponse):
+    stage: Literal['final'] = 'final'
+    confirming_sentence: str
+    situation: str
+
+# Unified response type, dispatched on "stage":
+NarrativeResponse = Annotated[
+    Union[InitialNarrativeResponse, RoundNarrativeResponse, FinalNarrativeResponse],
+    Field(discriminator="stage"),
+]
+
+# ============================
+# GEMINI OUTPUT MODELS
+# ============================
+# Structured (JSON) output requested from Gemini via response_schema. There is one
+# field per section of the text format, in the same order.
+
+class InitialNarrativeOutput(BaseModel):
+    model_config = MODEL_CONFIG
+
+    situation: str
+    action_1: str
+    action_1_confirm: str
+    action_2: str
+    action_2_confirm: str
+
+class RoundNarrativeOutput(BaseModel):
+    model_config = MODEL_CONFIG
+
+    confirming_sentence: str
+    situation: str
+    action_1: str
+    action_1_confirm: str
+    action_2: str
+    action_2_confirm: str
+
+class FinalNarrativeOutput(BaseModel):
+    model_config = MODEL_CONFIG
+
+    confirming_sentence: str
+    situation: str
@@ -7,17 +7,31 @@ Purpose:
 
 Inputs:
     - prompt (str): The prompt to be sent to the Gemini API.
+    - response_schema (optional): A pydantic model the response must be a JSON object of.
 
 Outputs:
-    - A string containing the response from the Gemini API (trimmed of extra whitespace).
+    - A string containing the response from the Gemini API (trimmed of extra whitespace),
+      returned by call_gemini or awaited from call_gemini_async; a list of them, in
+      prompt order, from call_gemini_many; or, for call_gemini_stream, the response
+      text chunk by chunk.
 
 Guardrails:
-    - Expects the environment variable GEMINI_API_KEY to be set.
-    - Any errors from the underlying client are propagated to the caller.
+    - Expects the environment variable GEMINI_API_KEY to be set (read when the client is first used).
+    - API and transport errors from the underlying client are raised as GeminiAPIError.
+    - Concurrent identical prompts share a single upstream request.
+    - With DEBUG_GEMINI=yes, prompts and raw responses are logged to the "gemini" logger.
 """
 import os
+import asyncio
+import hashlib
+import logging
+from functools import lru_cache
+from typing import AsyncIterator, Optional
+import httpx
 # import dotenv
 from google import genai
+from google.genai import errors, types
+from utils.cache import SingleFlight
 
 # try fetching the API key from the environment
 # if not found, use the fallback value
@@ -27,26 +41,173 @@ from google import genai
 #     dotenv.load_dotenv()
 #     API_KEY = os.getenv("GEMINI_API_KEY")
 
-API_KEY = os.environ["GEMINI_API_KEY"]
+MODEL_NAME = "gemini-2.0-flash"
 
-# Create a new client instance using the API key.
-client = genai.Client(api_key=API_KEY)
+# Set DEBUG_GEMINI=yes to log every prompt and raw response. Messages use deferred
+# %s formatting, so the multi-KB strings are only formatted when debug logging is on.
+DEBUG_GEMINI = os.environ.get("DEBUG_GEMINI", "no").lower() in ("yes", "true", "1")
+logger = logging.getLogger("gemini")
+if DEBUG_GEMINI:
+    logger.setLevel(logging.DEBUG)
+    logger.addHandler(logging.StreamHandler())
 
-def call_gemini(prompt: str) -> str:
+# Connection pool shared by every Gemini call, so TLS handshakes and DNS lookups
+# are paid once per connection rather than once per request. Connections speak HTTP/2
+# (needs httpx[http2]), so concurrent calls are multiplexed over one connection.
+HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=50, keepalive_expiry=30)
+HTTP_TIMEOUT = httpx.Timeout(30.0, connect=5.0)
+
+# Upper bound on Gemini calls in flight at once for a single call_gemini_many batch.
+MAX_CONCURRENT_CALLS = 8
+
+# Concurrent calls with an identical prompt share one upstream request.
+_inflight = SingleFlight()
+
+class GeminiAPIError(Exception):
+    """
+    Raised when a request to the Gemini API fails (API error or transport failure).
+    """
+
+@lru_cache(maxsize=1)
+def get_client() -> genai.Client:
+    """
+    Returns the shared Gemini client, creating it on first use.
+
+    The client is stateless, so one instance is reused for every call instead of
+    being rebuilt per request or per import. Its sync and async transports share
+    the pool limits and timeouts defined above.
+    """
+    return genai.Client(
+        api_key=os.environ["GEMINI_API_KEY"],
+        http_options=types.HttpOptions(
+            # The SDK passes its own per-request timeout (in ms) through to httpx.
+            timeout=int(HTTP_TIMEOUT.read * 1000),
+            httpx_client=httpx.Client(http2=True, limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT),
+            httpx_async_client=httpx.AsyncClient(http2=True, limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT),
+        ),
+    )
+
+async def warm_up() -> None:
+    """
+    Creates the shared client and opens a pooled connection to the Gemini API.
+
+    Fetching the model metadata costs no tokens but pays the client setup, DNS lookup
+    and TLS handshake up front, so the first real prompt does not. The async transport
+    is warmed, as that is the one the API uses.
+    """
+    await get_client().aio.models.get(model=MODEL_NAME)
+
+def prompt_key(prompt: str) -> str:
+    """
+    Returns the key identifying a prompt for request coalescing.
+    """
+    return hashlib.blake2b(prompt.encode()).hexdigest()
+
+@lru_cache(maxsize=8)
+def json_output_config(response_schema: type) -> types.GenerateContentConfig:
+    """
+    Returns the generation config asking Gemini for JSON matching a pydantic model.
+    """
+    return types.GenerateContentConfig(response_mime_type="application/json", response_schema=response_schema)
+
+def call_gemini(prompt: str, response_schema: Optional[type] = None) -> str:
     """
     Sends a prompt to the Gemini API as a new conversation and returns the generated content.
 
+    Identical prompts sent concurrently wait on a single in-flight request.
+
     Parameters:
         prompt (str): The prompt text to send.
+        response_schema (type, optional): A pydantic model; if given, Gemini answers with
+                                          a JSON object matching it (structured output).
 
     Returns:
         str: The trimmed response text from Gemini.
     """
-    # Create a new chat conversation for each API call.
-    chat = client.chats.create(model="gemini-2.0-flash")
+    return _inflight.do(prompt_key(prompt), lambda: _fetch(prompt, response_schema))
+
+async def call_gemini_async(prompt: str, response_schema: Optional[type] = None) -> str:
+    """
+    Async variant of call_gemini, using the client's async transport.
 
-    # Send the prompt as a message in this fresh conversation.
-    response = chat.send_message(prompt)
+    Identical prompts sent concurrently (from either variant) wait on a single in-flight request.
+
+    Parameters:
+        prompt (str): The prompt text to send.
+        response_schema (type, optional): As for call_gemini.
+
+    Returns:
+        str: The trimmed response text from Gemini.
+    """
+    return await _inflight.do_async(prompt_key(prompt), lambda: _fetch_async(prompt, response_schema))
+
+async def call_gemini_many(
+    prompts: list,
+    response_schemas: Optional[list] = None,
+    max_concurrency: int = MAX_CONCURRENT_CALLS
+) -> list:
+    """
+    Sends several independent prompts to the Gemini API concurrently.
+
+    Parameters:
+        prompts (list): The prompt texts to send.
+        response_schemas (list, optional): The response_schema (see call_gemini) for each prompt.
+        max_concurrency (int): Maximum number of calls in flight at once.
+
+    Returns:
+        list: The trimmed response texts, in the order of the prompts.
+
+    Raises:
+        GeminiAPIError: If any of the calls fails.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+    if response_schemas is None:
+        response_schemas = [None] * len(prompts)
+
+    async def call(prompt: str, response_schema: Optional[type]) -> str:
+        async with semaphore:
+            return await call_gemini_async(prompt, response_schema)
+
+    return list(await asyncio.gather(*(call(*args) for args in zip(prompts, response_schemas))))
+
+async def _fetch_async(prompt: str, response_schema: Optional[type]) -> str:
+    logger.debug("FULL PROMPT:\n%s", prompt)
+    config = json_output_config(response_schema) if response_schema is not None else None
+    try:
+        response = await get_client().aio.models.generate_content(model=MODEL_NAME, contents=prompt, config=config)
+    except (errors.APIError, httpx.HTTPError) as e:
+        raise GeminiAPIError(f"Gemini request failed: {e}") from e
+    logger.debug("RAW RESPONSE:\n%s", response.text)
+    return response.text.strip()
+
+def _fetch(prompt: str, response_schema: Optional[type]) -> str:
+    # Each call is a one-shot prompt, so use the stateless endpoint rather than a chat session.
+    logger.debug("FULL PROMPT:\n%s", prompt)
+    config = json_output_config(response_schema) if response_schema is not None else None
+    try:
+        response = get_client().models.generate_content(model=MODEL_NAME, contents=prompt, config=config)
+    except (errors.APIError, httpx.HTTPError) as e:
+        raise GeminiAPIError(f"Gemini request failed: {e}") from e
+    logger.debug("RAW RESPONSE:\n%s", response.text)
 
     # Return the trimmed response text.
-    return response.text.strip()
\ No newline at end of file
+    return response.text.strip()
+
+async def call_gemini_stream(prompt: str) -> AsyncIterator[str]:
+    """
+    Sends a prompt to the Gemini API and yields the response text as it is generated.
+
+    Parameters:
+        prompt (str): The prompt text to send.
+
+    Yields:
+        str: Successive chunks of the response text.
+    """
+    logger.debug("FULL PROMPT:\n%s", prompt)
+    try:
+        stream = await get_client().aio.models.generate_content_stream(model=MODEL_NAME, contents=prompt)
+        async for chunk in stream:
+            if chunk.text:
+                yield chunk.text
+    except (errors.APIError, httpx.HTTPError) as e:
+        raise GeminiAPIError(f"Gemini request failed: {e}") from e
@@ -1,14 +1,246 @@
 # ./backend/services/narrative_service.py
 
 import os
-import json
-from services.gemini_service import call_gemini
-from utils.parser import parse_narrative_response
+import asyncio
+import string
+import hashlib
+import orjson
+from functools import lru_cache
+from types import MappingProxyType
+from typing import AsyncIterator, Optional
+from pydantic import ValidationError
+from models.narrative import (
+    Choice,
+    NarrativeResponse,
+    InitialNarrativeResponse,
+    RoundNarrativeResponse,
+    FinalNarrativeResponse,
+)
+from services.gemini_service import call_gemini, call_gemini_async, call_gemini_many, call_gemini_stream
+from utils import semantic_cache
+from utils.cache import TTLCache
+from utils.parser import (
+    STAGE_OUTPUT_MODELS,
+    WHITE_RABBIT,
+    NarrativeFormatError,
+    SectionSplitter,
+    compile_pattern,
+    parse_narrative_json,
+    parse_narrative_response,
+    parse_narrative_sections,
+)
 
-# Load prompt templates and regex patterns from the JSON configuration file.
 CONFIG_PATH = os.path.join(os.path.dirname(__file__), '..', 'config', 'prompts.json')
-with open(CONFIG_PATH, 'r') as f:
-    PROMPT_CONFIG = json.load(f)
+
+@lru_cache(maxsize=4)
+def _load_config(path: str, mtime_ns: int) -> MappingProxyType:
+    """
+    Loads prompt templates and regex patterns from a JSON configuration file as a read-only mapping.
+
+    The file's modification time is part of the cache key, so each version of the file
+    is parsed once per process and an edited file is parsed again when reloaded.
+    """
+    with open(path, 'rb') as f:
+        config = orjson.loads(f.read())
+    return MappingProxyType({key: MappingProxyType(stage_config) for key, stage_config in config.items()})
+
+PROMPT_CONFIG = _load_config(CONFIG_PATH, os.stat(CONFIG_PATH).st_mtime_ns)
+
+# (prefix per parser mode, suffix, compiled response pattern) per template, keyed like
+# PROMPT_CONFIG, so building a prompt takes a single lookup. Each prefix ends with the
+# output format instructions of its mode. Patterns are compiled once at import.
+PROMPT_TEMPLATES = {
+    key: (
+        {mode: config["prefix"] + output_format for mode, output_format in config["format"].items()},
+        config["suffix"],
+        compile_pattern(config["regex"]),
+    )
+    for key, config in PROMPT_CONFIG.items()
+}
+
+# Gemini answers with structured JSON matching the stage's output model by default. Set
+# PARSER_MODE=legacy for the labelled text format ("SITUATION: ..."), parsed by the line
+# or regex parser; streaming always uses the text format.
+PARSER_MODE = "legacy" if os.environ.get("PARSER_MODE", "json").lower() == "legacy" else "json"
+
+# Exact-match cache of parsed narratives, keyed by prompt and stage. A hit skips both
+# the Gemini call and parsing. Behind it sits the optional semantic (near-duplicate)
+# cache in utils/semantic_cache.py. Set LLM_CACHE_ENABLED=no to always call Gemini.
+LLM_CACHE_ENABLED = os.environ.get("LLM_CACHE_ENABLED", "yes").lower() in ("yes", "true", "1")
+_narrative_cache = TTLCache(maxsize=1024, ttl=3600)
+
+def preload() -> None:
+    """
+    Loads what the first request would otherwise load lazily: the optional semantic
+    cache's embedding model, which can take seconds. Prompt templates and response
+    patterns are already loaded at import.
+    """
+    if LLM_CACHE_ENABLED:
+        semantic_cache.warm_up()
+
+def narrative_cache_key(prompt: str, stage: str) -> str:
+    """
+    Returns the narrative cache key for a formatted prompt and stage.
+    """
+    return hashlib.sha256(f"{prompt}|{stage}".encode()).hexdigest()
+
+# Characters from the end of the narrative context that are embedded for the semantic
+# cache; together with the action they stay well inside the embedding model's 256 tokens.
+SEMANTIC_CONTEXT_CHARS = 600
+
+def semantic_cache_key(
+    stage: str,
+    language: str = "",
+    narrative_context: str = "",
+    action: str = "",
+    outcome_value: int = 0,
+    action_confirming_sentence: str = "",
+    win_or_loss: str = ""
+) -> Optional[tuple]:
+    """
+    Returns the (text, partition) a request is looked up under in the semantic cache, or
+    None if its stage is not semantically cached or the semantic cache is unavailable
+    (sentence-transformers is not installed), so callers skip it without any work.
+
+    Only the request's own fields are embedded: the action and the latest part of the
+    narrative context. The static prompt prefix is the same for every request and would
+    fill the embedding model's input window. Fields that must never be mixed up (stage,
+    language, and the outcome value or win_or_loss) form the exact partition instead, so
+    e.g. a loss is never answered with a cached win. "initial" prompts have no
+    per-request fields and are left to the exact cache.
+
+    Optional request fields may be None and are embedded as empty text.
+    """
+    if not semantic_cache.AVAILABLE:
+        return None
+    context_tail = (narrative_context or "")[-SEMANTIC_CONTEXT_CHARS:]
+    if stage == "round":
+        text = f"{action or ''}\n{action_confirming_sentence or ''}\n{context_tail}"
+        return text, (stage, language, outcome_value)
+    if stage == "final":
+        return context_tail, (stage, language, win_or_loss)
+    return None
+
+@lru_cache(maxsize=64)
+def prompt_prefix(config_key: str, language: str, parser_mode: str = "json") -> str:
+    """
+    Returns the formatted static prefix of a prompt template for a language.
+
+    Each template is split into a static "prefix" (role, instructions, language
+    directive and output format) and a "suffix" holding the per-request fields.
+    Keeping all static text first lets Gemini's implicit prompt caching reuse the
+    shared prefix across requests. The prefix depends on nothing but the language
+    and the parser mode (which selects the output format), so each variant is built
+    once and reused; for the "initial" stage it is the whole prompt.
+    """
+    return PROMPT_TEMPLATES[config_key][0][parser_mode].format(language=language)
+
+_CONVERSIONS = {"r": repr, "s": str, "a": ascii}
+
+def parse_template(template: str) -> tuple:
+    """
+    Splits a str.format template into (literal text, field name, format spec, conversion)
+    parts, as string.Formatter().parse does, so it is scanned for placeholders only once.
+
+    Raises:
+        ValueError: If the template uses attribute or index lookups or nested fields,
+                    which _fast_format does not support.
+    """
+    parsed = tuple(string.Formatter().parse(template))
+    for _, field_name, format_spec, _ in parsed:
+        if field_name is not None and (not field_name.isidentifier() or "{" in format_spec):
+            raise ValueError(f"Unsupported template field: {{{field_name}:{format_spec}}}")
+    return parsed
+
+def _fast_format(parsed_template: tuple, fields: dict) -> str:
+    """
+    Formats a template pre-split by parse_template; same result as template.format(**fields).
+    """
+    parts = []
+    for literal, field_name, format_spec, conversion in parsed_template:
+        parts.append(literal)
+        if field_name is not None:
+            value = fields[field_name]
+            if conversion:
+                value = _CONVERSIONS[conversion](value)
+            parts.append(format(value, format_spec))
+    return "".join(parts)
+
+def _format_initial(template: tuple, **fields) -> str:
+    return _fast_format(template, {})
+
+def _format_round(template: tuple, narrative_context, action, outcome_value, action_confirming_sentence, **fields) -> str:
+    return _fast_format(template, {
+        "narrative_context": narrative_context,
+        "action": action,
+        "outcome_value": outcome_value,
+        "action_confirming_sentence": action_confirming_sentence,
+    })
+
+def _format_final(template: tuple, narrative_context, win_or_loss, **fields) -> str:
+    return _fast_format(template, {"narrative_context": narrative_context, "win_or_loss": win_or_loss})
+
+# stage -> (template key in PROMPT_CONFIG, formatter filling the template's suffix with the
+# stage's fields, response model the parsed narrative is validated into)
+_STAGE_SPECS = {
+    "initial": ("first_round_context", _format_initial, InitialNarrativeResponse),
+    "round": ("round_context", _format_round, RoundNarrativeResponse),
+    "final": ("final_wrapping", _format_final, FinalNarrativeResponse),
+}
+
+# The same table with each stage's suffix template (pre-split by parse_template) and
+# compiled response pattern resolved from PROMPT_TEMPLATES at import, so a request needs
+# a single flat lookup:
+# stage -> (template key, parsed suffix template, compiled pattern, suffix formatter, response model)
+_STAGES = {
+    stage: (
+        config_key,
+        parse_template(PROMPT_TEMPLATES[config_key][1]),
+        PROMPT_TEMPLATES[config_key][2],
+        format_suffix,
+        response_model,
+    )
+    for stage, (config_key, format_suffix, response_model) in _STAGE_SPECS.items()
+}
+
+def build_prompt(
+    stage: str,
+    language: str = "",
+    narrative_context: str = "",
+    action: str = "",
+    outcome_value: int = 0,
+    action_confirming_sentence: str = "",
+    win_or_loss: str = "",
+    parser_mode: str = ""
+) -> tuple:
+    """
+    Builds the Gemini prompt for a stage and returns it with the stage's compiled response pattern.
+
+    Arguments follow the same rules as generate_narrative. parser_mode ("json" or "legacy",
+    defaults to PARSER_MODE) selects the output format the prompt asks for.
+
+    Returns:
+        tuple: (prompt, compiled regex pattern)
+
+    Raises:
+        ValueError: If the stage is not "initial", "round", or "final".
+    """
+    try:
+        config_key, suffix_template, regex_pattern, format_suffix, _ = _STAGES[stage]
+    except KeyError:
+        raise ValueError("Invalid stage. Must be one of 'initial', 'round', or 'final'.") from None
+
+    # The static prefix (with the language directive) comes first, the request's fields last.
+    prompt = prompt_prefix(config_key, language, parser_mode or PARSER_MODE) + format_suffix(
+        suffix_template,
+        narrative_context=narrative_context,
+        action=action,
+        outcome_value=outcome_value,
+        action_confirming_sentence=action_confirming_sentence,
+        win_or_loss=win_or_loss
+    )
+
+    return prompt, regex_pattern
 
 def generate_narrative(
     stage: str,
@@ -18,7 +250,7 @@ def generate_narrative(
     outcome_value: int = 0,
     action_confirming_sentence: str = "",
     win_or_loss: str = ""
-) -> dict:
+) -> NarrativeResponse:
     """
     Unified narrative generator function.
 
@@ -39,7 +271,8 @@ def generate_narrative(
                 - win_or_loss (str): Either "win" or "loss" (case-insensitive).
               **Parameters action, outcome_value, and action_confirming_sentence are ignored.**
 
-    Expected Output Format:
+    Expected Output Format (returned as the stage's response model from models/narrative.py,
+    which also carries the stage):
 
         For "initial" stage:
             {
@@ -91,65 +324,236 @@ def generate_narrative(
         - For "round", win_or_loss is ignored.
         - For "final", only narrative_context and win_or_loss are used; other parameters are ignored.
 
+    Caching:
+        Parsed results are cached for an hour by exact prompt (unless LLM_CACHE_ENABLED=no),
+        and near-duplicate round and final requests (see semantic_cache_key) can be answered
+        by the optional semantic cache, so a request may return a shared model instance;
+        treat it as read-only.
+
     Returns:
-        dict: Parsed narrative data conforming to the above format.
-    """
-    if stage == "initial":
-        config_key = "first_round_context"
-    elif stage == "round":
-        config_key = "round_context"
-    elif stage == "final":
-        config_key = "final_wrapping"
-    else:
-        raise ValueError("Invalid stage. Must be one of 'initial', 'round', or 'final'.")
-
-    prompt_template = PROMPT_CONFIG[config_key]["prompt"]
-    regex_pattern = PROMPT_CONFIG[config_key]["regex"]
-
-    # Format the prompt based on the stage, always using the language parameter.
-    if stage == "initial":
-        prompt = prompt_template.format(language=language)
-    elif stage == "round":
-        prompt = prompt_template.format(
-            narrative_context=narrative_context,
-            action=action,
-            outcome_value=outcome_value,
-            action_confirming_sentence=action_confirming_sentence,
-            language=language
-        )
-    elif stage == "final":
-        prompt = prompt_template.format(
-            narrative_context=narrative_context,
-            win_or_loss=win_or_loss,
-            language=language
-        )
-
-    # Call the Gemini API.
-    raw_response = call_gemini(prompt)
-
-    # Parse the raw response.
-    parsed_data = parse_narrative_response(raw_response, stage, regex_pattern)
-
-    # Assertions for expected format.
-    if stage in ("initial", "round"):
-        assert "situation" in parsed_data, "Parsed narrative missing 'situation'"
-        assert "choices" in parsed_data, "Parsed narrative missing 'choices'"
-        assert isinstance(parsed_data["choices"], list) and len(
-            parsed_data["choices"]) == 2, "Expected exactly two choices"
-        for choice in parsed_data["choices"]:
-            assert "id" in choice, "Choice missing 'id'"
-            assert "choice_description" in choice, "Choice missing 'choice_description'"
-            assert "confirming_sentence" in choice, "Choice missing 'confirming_sentence'"
-            assert "outcome" in choice, "Choice missing 'outcome'"
-        # For the "round" stage, ensure a top-level confirming_sentence is present.
-        if stage == "round" and "confirming_sentence" not in parsed_data:
-            # As a fallback, use the confirming_sentence of the first choice.
-            if parsed_data["choices"]:
-                parsed_data["confirming_sentence"] = parsed_data["choices"][0].get("confirming_sentence", "")
-            else:
-                parsed_data["confirming_sentence"] = ""
-    elif stage == "final":
-        assert "confirming_sentence" in parsed_data, "Parsed final narrative missing 'confirming_sentence'"
-        assert "situation" in parsed_data, "Parsed final narrative missing 'situation'"
-
-    return parsed_data
\ No newline at end of file
+        NarrativeResponse: Parsed narrative data conforming to the above format.
+
+    Raises:
+        NarrativeFormatError: If the Gemini response does not match the expected format.
+    """
+    prompt, regex_pattern, cache_key, semantic_key = _prepare_narrative(
+        stage, language, narrative_context, action, outcome_value, action_confirming_sentence, win_or_loss
+    )
+
+    # Identical requests are answered from the cache.
+    cached = _cached_narrative(cache_key, semantic_key)
+    if cached is not None:
+        return cached
+
+    # Call the Gemini API and parse the raw response.
+    parsed_data = _parse_narrative(call_gemini(prompt, _response_schema(stage)), stage, regex_pattern)
+
+    _store_narrative(cache_key, semantic_key, parsed_data)
+    return parsed_data
+
+def _prepare_narrative(
+    stage: str,
+    language: str = "",
+    narrative_context: str = "",
+    action: str = "",
+    outcome_value: int = 0,
+    action_confirming_sentence: str = "",
+    win_or_loss: str = "",
+    parser_mode: str = ""
+) -> tuple:
+    """
+    Builds a request's prompt and the keys it is cached under.
+
+    Arguments follow build_prompt. The semantic cache key is None while caching is
+    disabled, so no embedding work is done for the request.
+
+    Returns:
+        tuple: (prompt, compiled regex pattern, narrative cache key, semantic cache key or None)
+    """
+    prompt, regex_pattern = build_prompt(
+        stage,
+        language=language,
+        narrative_context=narrative_context,
+        action=action,
+        outcome_value=outcome_value,
+        action_confirming_sentence=action_confirming_sentence,
+        win_or_loss=win_or_loss,
+        parser_mode=parser_mode
+    )
+    semantic_key = semantic_cache_key(
+        stage, language, narrative_context, action, outcome_value, action_confirming_sentence, win_or_loss
+    ) if LLM_CACHE_ENABLED else None
+    return prompt, regex_pattern, narrative_cache_key(prompt, stage), semantic_key
+
+def _cached_narrative(cache_key: str, semantic_key: Optional[tuple]):
+    if not LLM_CACHE_ENABLED:
+        return None
+    cached = _narrative_cache.get(cache_key)
+    if cached is None and semantic_key is not None:
+        cached = semantic_cache.lookup(*semantic_key)
+    return cached
+
+def _store_narrative(cache_key: str, semantic_key: Optional[tuple], parsed_data) -> None:
+    if LLM_CACHE_ENABLED:
+        _narrative_cache.set(cache_key, parsed_data)
+        if semantic_key is not None:
+            semantic_cache.insert(*semantic_key, parsed_data)
+
+def _response_schema(stage: str):
+    """
+    Returns the structured-output model Gemini should answer with, or None in legacy mode.
+    """
+    return STAGE_OUTPUT_MODELS[stage] if PARSER_MODE == "json" else None
+
+def _parse_narrative(raw_response: str, stage: str, regex_pattern, parser_mode: str = "") -> NarrativeResponse:
+    """
+    Parses a raw Gemini response into the stage's response model.
+
+    Each response is validated exactly once: structured (JSON) responses by
+    parse_narrative_json against the stage's output model, text responses here
+    against the response model.
+    """
+    if (parser_mode or PARSER_MODE) == "json":
+        return _construct_narrative(parse_narrative_json(raw_response, stage), stage)
+    return _validate_narrative(parse_narrative_response(raw_response, stage, regex_pattern), stage)
+
+def _construct_narrative(parsed_data: dict, stage: str) -> NarrativeResponse:
+    # The fields were already validated against the output model, so skip a second validation.
+    if "choices" in parsed_data:
+        parsed_data = {**parsed_data, "choices": [Choice.model_construct(**choice) for choice in parsed_data["choices"]]}
+    return _STAGES[stage][-1].model_construct(**parsed_data)
+
+def _validate_narrative(parsed_data: dict, stage: str) -> NarrativeResponse:
+    response_model = _STAGES[stage][-1]
+    try:
+        return response_model.model_validate(parsed_data)
+    except ValidationError as e:
+        raise NarrativeFormatError(f"{stage.capitalize()} narrative does not match the response model: {e}") from e
+
+async def generate_narrative_async(
+    stage: str,
+    language: str = "",
+    narrative_context: str = "",
+    action: str = "",
+    outcome_value: int = 0,
+    action_confirming_sentence: str = "",
+    win_or_loss: str = ""
+) -> NarrativeResponse:
+    """
+    Async variant of generate_narrative, used by the API.
+
+    Arguments, output format and caching are the same as for generate_narrative. The
+    Gemini call is awaited on the event loop through the async client, so a worker
+    serves other requests while it waits; the optional semantic cache, whose
+    embedding work is CPU-bound, runs in a worker thread.
+
+    Returns:
+        NarrativeResponse: Parsed narrative data in the format documented on generate_narrative.
+    """
+    prompt, regex_pattern, cache_key, semantic_key = _prepare_narrative(
+        stage, language, narrative_context, action, outcome_value, action_confirming_sentence, win_or_loss
+    )
+
+    cached = await _cached_narrative_async(cache_key, semantic_key)
+    if cached is not None:
+        return cached
+
+    parsed_data = _parse_narrative(await call_gemini_async(prompt, _response_schema(stage)), stage, regex_pattern)
+
+    await _store_narrative_async(cache_key, semantic_key, parsed_data)
+    return parsed_data
+
+async def generate_narratives_bulk(requests: list) -> list:
+    """
+    Generates several independent narratives concurrently.
+
+    All prompts are built first; the ones not answered from the cache are then sent
+    to Gemini together through call_gemini_many.
+
+    Parameters:
+        requests (list): One dict of generate_narrative keyword arguments per narrative,
+                         e.g. {"stage": "initial", "language": "Deutsch"}.
+
+    Returns:
+        list: The narratives, as returned by generate_narrative, in request order.
+    """
+    prepared = [_prepare_narrative(**request) for request in requests]
+    results = list(await asyncio.gather(*(
+        _cached_narrative_async(cache_key, semantic_key)
+        for _, _, cache_key, semantic_key in prepared
+    )))
+
+    missing = [i for i, result in enumerate(results) if result is None]
+    raw_responses = await call_gemini_many(
+        [prepared[i][0] for i in missing],
+        [_response_schema(requests[i]["stage"]) for i in missing]
+    )
+    for i, raw_response in zip(missing, raw_responses):
+        _, regex_pattern, cache_key, semantic_key = prepared[i]
+        results[i] = _parse_narrative(raw_response, requests[i]["stage"], regex_pattern)
+        await _store_narrative_async(cache_key, semantic_key, results[i])
+    return results
+
+# Async counterparts of _cached_narrative and _store_narrative. The semantic cache's
+# embedding work is CPU-bound, so it runs in a worker thread; the exact cache does not.
+async def _cached_narrative_async(cache_key: str, semantic_key: Optional[tuple]):
+    cached = _cached_narrative(cache_key, None)
+    if cached is None and semantic_key is not None:
+        cached = await asyncio.to_thread(semantic_cache.lookup, *semantic_key)
+    return cached
+
+async def _store_narrative_async(cache_key: str, semantic_key: Optional[tuple], parsed_data) -> None:
+    _store_narrative(cache_key, None, parsed_data)
+    if semantic_key is not None:
+        await asyncio.to_thread(semantic_cache.insert, *semantic_key, parsed_data)
+
+async def generate_narrative_stream(
+    stage: str,
+    language: str = "",
+    narrative_context: str = "",
+    action: str = "",
+    outcome_value: int = 0,
+    action_confirming_sentence: str = "",
+    win_or_loss: str = ""
+) -> AsyncIterator[tuple]:
+    """
+    Streaming variant of generate_narrative.
+
+    Arguments follow the same rules as generate_narrative. While Gemini is still
+    generating, each labelled section of the response is yielded as soon as it is
+    complete; once the response has ended, the fully parsed narrative is yielded.
+    Streams always call Gemini, but their parsed result is stored in the narrative cache.
+
+    Yields:
+        tuple: ("section", label, text) for every section, e.g. ("section", "SITUATION", "..."),
+               followed by a single ("result", parsed_data) with the same model generate_narrative returns.
+
+    Raises:
+        ValueError: If the stage is invalid or the complete response does not match the expected format.
+    """
+    prompt, _, cache_key, semantic_key = _prepare_narrative(
+        stage, language, narrative_context, action, outcome_value, action_confirming_sentence, win_or_loss,
+        # Sections can only be split off while streaming in the text format.
+        parser_mode="legacy"
+    )
+
+    # Sections are collected as they complete, so the narrative is assembled from them
+    # once the last one arrives instead of parsing the whole response again.
+    splitter = SectionSplitter()
+    sections = {}
+    async for chunk in call_gemini_stream(prompt):
+        for label, text in splitter.feed(chunk):
+            sections[label] = text
+            yield _section_event(stage, label, text)
+    for label, text in splitter.close():
+        sections[label] = text
+        yield _section_event(stage, label, text)
+
+    parsed_data = _validate_narrative(parse_narrative_sections(sections, stage), stage)
+    await _store_narrative_async(cache_key, semantic_key, parsed_data)
+    yield "result", parsed_data
+
+def _section_event(stage: str, label: str, text: str) -> tuple:
+    if stage == "initial" and label == "SITUATION":
+        text = WHITE_RABBIT.sub("", text)
+    return "section", label, text
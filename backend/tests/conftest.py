@@ -0,0 +1,69 @@
+# ./backend/tests/conftest.py
+import sys
+import pathlib
+
+# Make the backend's top-level packages (services, utils, models) and app importable, once per session.
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+import pytest
+from unittest.mock import AsyncMock, patch
+from fastapi.testclient import TestClient
+from fixtures.gemini_responses import gemini_response
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "integration: calls the real Gemini API (run with -m integration)")
+
+
+def pytest_collection_modifyitems(config, items):
+    # Integration tests need GEMINI_API_KEY and network access; they only run when selected.
+    if "integration" in (config.getoption("-m") or ""):
+        return
+    skip = pytest.mark.skip(reason="integration test; run with -m integration")
+    for item in items:
+        if item.get_closest_marker("integration"):
+            item.add_marker(skip)
+
+
+@pytest.fixture(autouse=True)
+def fake_gemini(request):
+    """
+    Answers every Gemini call with the canned responses in fixtures/gemini_responses.py,
+    except in integration tests. Tests patching a call themselves take precedence.
+    """
+    if request.node.get_closest_marker("integration"):
+        yield
+        return
+
+    async def call_gemini_async(prompt, response_schema=None):
+        return gemini_response(prompt, response_schema)
+
+    async def call_gemini_stream(prompt):
+        for line in gemini_response(prompt).splitlines(keepends=True):
+            yield line
+
+    with patch("services.narrative_service.call_gemini", side_effect=gemini_response), \
+            patch("services.narrative_service.call_gemini_async", side_effect=call_gemini_async), \
+            patch("services.gemini_service.call_gemini_async", side_effect=call_gemini_async), \
+            patch("services.narrative_service.call_gemini_stream", side_effect=call_gemini_stream):
+        yield
+
+
+@pytest.fixture(scope="session")
+def client():
+    """
+    TestClient shared by the whole session, so the app starts once. The startup warm-up
+    (Gemini client and embedding model) is skipped, since it would reach the network.
+    """
+    from app import app
+
+    with patch("app.warm_up", new_callable=AsyncMock), patch("app.preload"), TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture(scope="class")
+def api_client(request, client):
+    """
+    Exposes the session TestClient to unittest-style test classes as self.client.
+    """
+    request.cls.client = client
@@ -0,0 +1,72 @@
+# ./backend/tests/fixtures/gemini_responses.py
+"""
+Canned Gemini answers for tests, keyed by stage and then by output format: "json" for
+structured output (the default PARSER_MODE) and "legacy" for the labelled text format,
+which is also what streaming requests get.
+"""
+import json
+
+GEMINI_RESPONSES = {
+    "initial": {
+        "json": json.dumps({
+            "situation": "Follow the white rabbit. A mysterious alley in the rain.",
+            "action_1": "Enter the alley.",
+            "action_1_confirm": "You step forward into the darkness.",
+            "action_2": "Walk away.",
+            "action_2_confirm": "You decide to stay safe.",
+        }),
+        "legacy": (
+            "SITUATION: Follow the white rabbit. A mysterious alley in the rain.\n"
+            "ACTION 1: Enter the alley.\n"
+            "ACTION 1 CONFIRM: You step forward into the darkness.\n"
+            "ACTION 2: Walk away.\n"
+            "ACTION 2 CONFIRM: You decide to stay safe."
+        ),
+    },
+    "round": {
+        "json": json.dumps({
+            "confirming_sentence": "You hesitantly take the left turn.",
+            "situation": "The street twists into a labyrinth under neon glow.",
+            "action_1": "Turn left.",
+            "action_1_confirm": "You boldly step into the unknown.",
+            "action_2": "Turn right.",
+            "action_2_confirm": "You choose a safer path.",
+        }),
+        "legacy": (
+            "CONFIRMING SENTENCE: You hesitantly take the left turn.\n"
+            "SITUATION: The street twists into a labyrinth under neon glow.\n"
+            "ACTION 1: Turn left.\n"
+            "ACTION 1 CONFIRM: You boldly step into the unknown.\n"
+            "ACTION 2: Turn right.\n"
+            "ACTION 2 CONFIRM: You choose a safer path."
+        ),
+    },
+    "final": {
+        "json": json.dumps({
+            "confirming_sentence": "You accept your fate.",
+            "situation": "The world crumbles as you face the end.",
+        }),
+        "legacy": (
+            "CONFIRMING SENTENCE: You accept your fate.\n"
+            "SITUATION: The world crumbles as you face the end."
+        ),
+    },
+}
+
+
+def stage_of(prompt: str) -> str:
+    """
+    Tells the stage of a built prompt from the text of its per-request suffix.
+    """
+    if "LATEST CONFIRMING SENTENCE:" in prompt:
+        return "round"
+    if "The player's outcome is a" in prompt:
+        return "final"
+    return "initial"
+
+
+def gemini_response(prompt: str, response_schema=None) -> str:
+    """
+    Returns the canned answer to a prompt, in the format the call asked for.
+    """
+    return GEMINI_RESPONSES[stage_of(prompt)]["legacy" if response_schema is None else "json"]
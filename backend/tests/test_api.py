@@ -1,23 +1,18 @@
 # ./backend/tests/test_api.py
-import sys
-import os
+import json
 import unittest
+import pytest
+from unittest.mock import patch
 
-# Add the project's root directory to sys.path
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-
-from fastapi.testclient import TestClient
-from app import app  # Assumes your updated app.py is in the project root
-
-client = TestClient(app)
-
+# self.client is the session-wide TestClient from conftest.py.
+@pytest.mark.usefixtures("api_client")
 class TestAPINarrative(unittest.TestCase):
     def test_initial_narrative(self):
         # Test the 'initial' stage endpoint.
-        response = client.post("/api/narrative", json={"stage": "initial", "language": "Deutsch"})
+        response = self.client.post("/api/narrative", json={"stage": "initial", "language": "Deutsch"})
         # Expecting 200 since all languages are accepted.
         self.assertEqual(200, response.status_code)
-        # data = response.json()
+        data = response.json()
         self.assertEqual(data.get("stage"), "initial")
         self.assertIn("situation", data)
         self.assertIn("choices", data)
@@ -32,7 +27,7 @@ class TestAPINarrative(unittest.TestCase):
             "action_confirming_sentence": "Action confirmed",
             "language": "Deutsch"
         }
-        response = client.post("/api/narrative", json=payload)
+        response = self.client.post("/api/narrative", json=payload)
         data = response.json()
         print(data)  # This should show you the error detail from the exception.
         self.assertEqual(200, response.status_code)
@@ -41,6 +36,27 @@ class TestAPINarrative(unittest.TestCase):
         self.assertIn("situation", data)
         self.assertIn("choices", data)
 
+    # Build semantic cache keys even without sentence-transformers installed.
+    @patch("utils.semantic_cache.AVAILABLE", True)
+    def test_round_narrative_with_null_fields(self):
+        # Optional fields may be sent as null.
+        payload = {
+            "stage": "round",
+            "narrative_context": None,
+            "action": None,
+            "outcome_value": 1,
+            "action_confirming_sentence": None,
+            "language": "Deutsch"
+        }
+        response = self.client.post("/api/narrative", json=payload)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(response.json().get("stage"), "round")
+
+        response = self.client.post("/api/narrative/stream", json=payload)
+        self.assertEqual(200, response.status_code)
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        self.assertEqual(lines[-1]["result"]["stage"], "round")
+
     def test_final_narrative(self):
         # Test the 'final' stage endpoint.
         payload = {
@@ -49,7 +65,7 @@ class TestAPINarrative(unittest.TestCase):
             "win_or_loss": "win",
             "language": "Deutsch"
         }
-        response = client.post("/api/narrative", json=payload)
+        response = self.client.post("/api/narrative", json=payload)
         data = response.json()
         # print(data)  # This should show you the error detail from the exception.
         self.assertEqual(200, response.status_code)
@@ -57,5 +73,20 @@ class TestAPINarrative(unittest.TestCase):
         self.assertIn("confirming_sentence", data)
         self.assertIn("situation", data)
 
+    def test_stream_narrative(self):
+        # Test the streaming endpoint: sections first, then the complete result.
+        payload = {
+            "stage": "final",
+            "narrative_context": "Test stream context",
+            "win_or_loss": "loss",
+            "language": "Deutsch"
+        }
+        response = self.client.post("/api/narrative/stream", json=payload)
+        self.assertEqual(200, response.status_code)
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        self.assertEqual([line.get("section") for line in lines[:2]], ["CONFIRMING SENTENCE", "SITUATION"])
+        self.assertEqual(lines[-1]["result"]["stage"], "final")
+        self.assertIn("situation", lines[-1]["result"])
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
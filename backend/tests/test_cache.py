@@ -0,0 +1,131 @@
+import asyncio
+import threading
+import unittest
+from unittest.mock import AsyncMock, patch
+from utils.cache import SingleFlight, TTLCache
+
+class TestTTLCache(unittest.TestCase):
+
+    def test_get_and_set(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("missing"))
+
+    def test_evicts_least_recently_used(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(len(cache), 2)
+
+    @patch("utils.cache.time.monotonic")
+    def test_entries_expire(self, mock_monotonic):
+        cache = TTLCache(maxsize=2, ttl=10)
+        mock_monotonic.return_value = 100.0
+        cache.set("a", 1)
+        mock_monotonic.return_value = 109.0
+        self.assertEqual(cache.get("a"), 1)
+        mock_monotonic.return_value = 110.0
+        self.assertIsNone(cache.get("a"))
+
+class TestSingleFlight(unittest.TestCase):
+
+    def test_concurrent_calls_share_one_execution(self):
+        flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def slow():
+            calls.append(1)
+            started.set()
+            release.wait(timeout=5)
+            return "result"
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(flight.do("key", slow)))
+        leader.start()
+        started.wait(timeout=5)
+        followers = [threading.Thread(target=lambda: results.append(flight.do("key", slow))) for _ in range(3)]
+        for t in followers:
+            t.start()
+        release.set()
+        for t in [leader] + followers:
+            t.join(timeout=5)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ["result"] * 4)
+
+    def test_exception_is_propagated_and_key_released(self):
+        flight = SingleFlight()
+
+        def fail():
+            raise RuntimeError("boom")
+
+        with self.assertRaises(RuntimeError):
+            flight.do("key", fail)
+        self.assertEqual(flight.do("key", lambda: "ok"), "ok")
+
+class TestSingleFlightAsync(unittest.IsolatedAsyncioTestCase):
+
+    async def test_concurrent_awaits_share_one_execution(self):
+        flight = SingleFlight()
+        calls = []
+
+        async def slow():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "result"
+
+        results = await asyncio.gather(*(flight.do_async("key", slow) for _ in range(4)))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ["result"] * 4)
+        self.assertEqual(await flight.do_async("key", slow), "result")
+        self.assertEqual(len(calls), 2)
+
+    async def test_cancelled_follower_does_not_affect_others(self):
+        flight = SingleFlight()
+        release = asyncio.Event()
+
+        async def slow():
+            await release.wait()
+            return "result"
+
+        leader = asyncio.create_task(flight.do_async("key", slow))
+        await asyncio.sleep(0)
+        cancelled = asyncio.create_task(flight.do_async("key", slow))
+        follower = asyncio.create_task(flight.do_async("key", slow))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.sleep(0)
+        release.set()
+
+        self.assertEqual(await leader, "result")
+        self.assertEqual(await follower, "result")
+        with self.assertRaises(asyncio.CancelledError):
+            await cancelled
+
+    async def test_cancelled_leader_fails_followers_with_error(self):
+        flight = SingleFlight()
+
+        async def slow():
+            await asyncio.sleep(10)
+
+        leader = asyncio.create_task(flight.do_async("key", slow))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flight.do_async("key", slow))
+        await asyncio.sleep(0)
+        leader.cancel()
+
+        with self.assertRaises(asyncio.CancelledError):
+            await leader
+        with self.assertRaises(RuntimeError):
+            await follower
+        self.assertEqual(await flight.do_async("key", AsyncMock(return_value="ok")), "ok")
+
+if __name__ == '__main__':
+    unittest.main()
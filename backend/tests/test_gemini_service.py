@@ -1,19 +1,20 @@
 # ./backend/tests/test_gemini_service.py
 
-import sys
 import os
-# Add the project's root directory to sys.path
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-
+import asyncio
 import unittest
+import pytest
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
 from dotenv import load_dotenv
 
 # Load environment variables from .env (assumes .env is in the project root)
 load_dotenv()
 
-from services.gemini_service import call_gemini
+from services.gemini_service import call_gemini, call_gemini_many
 
 
+@pytest.mark.integration
 class TestGeminiServiceIntegration(unittest.TestCase):
     def test_call_gemini_integration(self):
         # Retrieve the API key (it should now be loaded from the .env file)
@@ -28,5 +29,42 @@ class TestGeminiServiceIntegration(unittest.TestCase):
         self.assertEqual(result, "This is a test.", "The Gemini service did not return the expected response.")
 
 
+class TestGeminiDebugLogging(unittest.TestCase):
+
+    @patch("services.gemini_service.get_client")
+    def test_prompt_and_response_are_logged_at_debug_level(self, mock_get_client):
+        client = MagicMock()
+        client.models.generate_content.return_value = SimpleNamespace(text=" Logged answer. ")
+        mock_get_client.return_value = client
+
+        with self.assertLogs("gemini", level="DEBUG") as logs:
+            result = call_gemini("Logged prompt")
+        self.assertEqual(result, "Logged answer.")
+        self.assertEqual(logs.output, [
+            "DEBUG:gemini:FULL PROMPT:\nLogged prompt",
+            "DEBUG:gemini:RAW RESPONSE:\n Logged answer. ",
+        ])
+
+
+class TestCallGeminiMany(unittest.IsolatedAsyncioTestCase):
+
+    @patch("services.gemini_service.call_gemini_async")
+    async def test_results_keep_prompt_order_and_concurrency_is_bounded(self, mock_call_gemini_async):
+        in_flight = []
+        peak = []
+
+        async def answer(prompt, response_schema=None):
+            in_flight.append(prompt)
+            peak.append(len(in_flight))
+            await asyncio.sleep(0.01 * (5 - int(prompt)))
+            in_flight.remove(prompt)
+            return f"answer {prompt}"
+        mock_call_gemini_async.side_effect = answer
+
+        results = await call_gemini_many([str(i) for i in range(5)], max_concurrency=2)
+        self.assertEqual(results, [f"answer {i}" for i in range(5)])
+        self.assertEqual(max(peak), 2)
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
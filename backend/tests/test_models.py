@@ -0,0 +1,17 @@
+import unittest
+from pydantic import ValidationError
+from models.narrative import FinalNarrativeRequest
+
+class TestFinalNarrativeRequest(unittest.TestCase):
+
+    def test_win_or_loss_is_case_insensitive(self):
+        for value, expected in (("win", "win"), ("WIN", "win"), ("Loss", "loss")):
+            req = FinalNarrativeRequest(language="Deutsch", narrative_context="ctx", win_or_loss=value)
+            self.assertEqual(req.win_or_loss, expected)
+
+    def test_win_or_loss_rejects_other_values(self):
+        with self.assertRaises(ValidationError):
+            FinalNarrativeRequest(language="Deutsch", narrative_context="ctx", win_or_loss="draw")
+
+if __name__ == '__main__':
+    unittest.main()
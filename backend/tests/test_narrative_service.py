@@ -1,14 +1,23 @@
-import sys
 import os
-# Add the project's root directory to sys.path
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-
 import unittest
-from unittest.mock import patch
-from services.narrative_service import generate_narrative
+from unittest.mock import AsyncMock, patch
+from models.narrative import FinalNarrativeResponse, RoundNarrativeOutput
+from services import narrative_service
+from services.narrative_service import (
+    generate_narrative,
+    generate_narrative_async,
+    generate_narrative_stream,
+    generate_narratives_bulk,
+)
 
+# These tests feed Gemini answers in the text format; TestNarrativeServiceJson covers structured output.
+@patch("services.narrative_service.PARSER_MODE", "legacy")
 class TestNarrativeService(unittest.TestCase):
 
+    def setUp(self):
+        narrative_service._narrative_cache.clear()
+        narrative_service.semantic_cache.clear()
+
     @patch("services.narrative_service.call_gemini")
     def test_generate_initial(self, mock_call_gemini):
         # Simulated valid response for the "initial" stage.
@@ -20,9 +29,10 @@ class TestNarrativeService(unittest.TestCase):
             "ACTION 2 CONFIRM: You decide to stay safe."
         )
         result = generate_narrative(stage="initial")
-        self.assertIn("situation", result)
-        self.assertIn("choices", result)
-        self.assertEqual(len(result["choices"]), 2)
+        self.assertEqual(result.stage, "initial")
+        self.assertEqual(result.situation, "A mysterious alley in the rain.")
+        self.assertEqual(len(result.choices), 2)
+        self.assertEqual(result.choices[1].outcome, "negative")
 
     @patch("services.narrative_service.call_gemini")
     def test_generate_round(self, mock_call_gemini):
@@ -41,10 +51,9 @@ class TestNarrativeService(unittest.TestCase):
             outcome_value=5,
             action_confirming_sentence="Action confirmed."
         )
-        self.assertIn("confirming_sentence", result)
-        self.assertIn("situation", result)
-        self.assertIn("choices", result)
-        self.assertEqual(len(result["choices"]), 2)
+        self.assertEqual(result.confirming_sentence, "You hesitantly take the left turn.")
+        self.assertEqual(result.situation, "The street twists into a labyrinth under neon glow.")
+        self.assertEqual(len(result.choices), 2)
 
     @patch("services.narrative_service.call_gemini")
     def test_generate_final(self, mock_call_gemini):
@@ -57,8 +66,241 @@ class TestNarrativeService(unittest.TestCase):
             narrative_context="Complete narrative context",
             win_or_loss="win"
         )
-        self.assertIn("confirming_sentence", result)
-        self.assertIn("situation", result)
+        self.assertEqual(result.confirming_sentence, "You accept your fate.")
+        self.assertEqual(result.situation, "The world crumbles as you face the end.")
+
+    @patch("services.narrative_service.semantic_cache.lookup", return_value=None)
+    @patch("services.narrative_service.call_gemini")
+    def test_identical_requests_are_cached(self, mock_call_gemini, mock_semantic_lookup):
+        mock_call_gemini.return_value = (
+            "CONFIRMING SENTENCE: You accept your fate.\n"
+            "SITUATION: The world crumbles as you face the end."
+        )
+        first = generate_narrative(stage="final", narrative_context="Context", win_or_loss="win")
+        second = generate_narrative(stage="final", narrative_context="Context", win_or_loss="win")
+        self.assertEqual(first, second)
+        mock_call_gemini.assert_called_once()
+
+        generate_narrative(stage="final", narrative_context="Other context", win_or_loss="win")
+        self.assertEqual(mock_call_gemini.call_count, 2)
+
+@patch("services.narrative_service.PARSER_MODE", "json")
+class TestNarrativeServiceJson(unittest.TestCase):
+
+    def setUp(self):
+        narrative_service._narrative_cache.clear()
+        narrative_service.semantic_cache.clear()
+
+    @patch("services.narrative_service.call_gemini")
+    def test_generate_round(self, mock_call_gemini):
+        mock_call_gemini.return_value = (
+            '{"confirming_sentence": "You hesitantly take the left turn.", '
+            '"situation": "The street twists into a labyrinth under neon glow.", '
+            '"action_1": "Turn left.", "action_1_confirm": "You boldly step into the unknown.", '
+            '"action_2": "Turn right.", "action_2_confirm": "You choose a safer path."}'
+        )
+        result = generate_narrative(
+            stage="round",
+            narrative_context="Some context",
+            action="Test action",
+            outcome_value=5,
+            action_confirming_sentence="Action confirmed."
+        )
+        prompt, response_schema = mock_call_gemini.call_args.args
+        self.assertIs(response_schema, RoundNarrativeOutput)
+        self.assertIn("action_1_confirm:", prompt)
+        self.assertEqual(result.confirming_sentence, "You hesitantly take the left turn.")
+        self.assertEqual(result.choices[1].choice_description, "Turn right.")
+        self.assertEqual(result.choices[1].outcome, "negative")
+        self.assertEqual(result.stage, "round")
+        self.assertEqual(result.model_dump()["choices"][0]["id"], 1)
+
+    @patch("services.narrative_service.call_gemini")
+    def test_response_is_validated_once(self, mock_call_gemini):
+        mock_call_gemini.return_value = '{"confirming_sentence": "You accept your fate.", "situation": "The end."}'
+        with patch.object(FinalNarrativeResponse, "model_validate") as mock_model_validate:
+            result = generate_narrative(stage="final", narrative_context="Context", win_or_loss="win")
+        mock_model_validate.assert_not_called()
+        self.assertEqual(result, FinalNarrativeResponse(confirming_sentence="You accept your fate.", situation="The end."))
+
+    @patch("services.narrative_service.call_gemini")
+    def test_malformed_json_raises_format_error(self, mock_call_gemini):
+        mock_call_gemini.return_value = '{"confirming_sentence": "You accept your fate."}'
+        with self.assertRaises(narrative_service.NarrativeFormatError):
+            generate_narrative(stage="final", narrative_context="Context", win_or_loss="win")
+
+@unittest.skipIf(narrative_service.semantic_cache.np is None, "numpy is not installed")
+@patch("services.narrative_service.PARSER_MODE", "legacy")
+@patch("utils.semantic_cache.AVAILABLE", True)
+class TestSemanticCacheKeys(unittest.TestCase):
+
+    def setUp(self):
+        narrative_service._narrative_cache.clear()
+        narrative_service.semantic_cache.clear()
+        # Every text embeds identically, so only the partition keeps requests apart.
+        self.embedded = []
+
+        def embed(text):
+            self.embedded.append(text)
+            return narrative_service.semantic_cache.np.array([1.0, 0.0])
+        patcher = patch("utils.semantic_cache._embed", embed)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch("services.narrative_service.call_gemini")
+    def test_round_outcomes_do_not_hit_each_other(self, mock_call_gemini):
+        mock_call_gemini.return_value = (
+            "CONFIRMING SENTENCE: You hesitantly take the left turn.\n"
+            "SITUATION: The street twists into a labyrinth under neon glow.\n"
+            "ACTION 1: Turn left.\n"
+            "ACTION 1 CONFIRM: You boldly step into the unknown.\n"
+            "ACTION 2: Turn right.\n"
+            "ACTION 2 CONFIRM: You choose a safer path."
+        )
+        request = dict(stage="round", language="Deutsch", narrative_context="Context", action="Run",
+                       action_confirming_sentence="You run.")
+        generate_narrative(outcome_value=1, **request)
+        generate_narrative(outcome_value=-1, **request)
+        self.assertEqual(mock_call_gemini.call_count, 2)
+
+        # A near-duplicate with the same outcome is answered from the semantic cache.
+        generate_narrative(outcome_value=1, **{**request, "narrative_context": "Other context"})
+        self.assertEqual(mock_call_gemini.call_count, 2)
+        # Only the request's own fields are embedded, never the static prompt prefix.
+        self.assertTrue(all(len(text) <= 100 for text in self.embedded))
+
+    @patch("services.narrative_service.call_gemini")
+    def test_final_win_and_loss_do_not_hit_each_other(self, mock_call_gemini):
+        mock_call_gemini.return_value = (
+            "CONFIRMING SENTENCE: You accept your fate.\n"
+            "SITUATION: The world crumbles as you face the end."
+        )
+        generate_narrative(stage="final", language="Deutsch", narrative_context="Context", win_or_loss="win")
+        generate_narrative(stage="final", language="Deutsch", narrative_context="Context", win_or_loss="loss")
+        self.assertEqual(mock_call_gemini.call_count, 2)
+
+class TestPromptConfig(unittest.TestCase):
+
+    def test_fast_format_matches_str_format(self):
+        fields = {"narrative_context": "Context {with braces}", "action": "Run", "outcome_value": 3,
+                  "action_confirming_sentence": "You run.", "win_or_loss": "win"}
+        for template in (
+            narrative_service.PROMPT_CONFIG["round_context"]["suffix"],
+            narrative_service.PROMPT_CONFIG["final_wrapping"]["suffix"],
+            "{{literal}} {action!r} {outcome_value:+d} {outcome_value:>4}",
+            "",
+        ):
+            parsed = narrative_service.parse_template(template)
+            self.assertEqual(narrative_service._fast_format(parsed, fields), template.format(**fields))
+
+    def test_unsupported_template_fields_are_rejected(self):
+        for template in ("{context.title}", "{choices[0]}", "{value:{width}}"):
+            with self.assertRaises(ValueError):
+                narrative_service.parse_template(template)
+
+    def test_config_is_read_only(self):
+        with self.assertRaises(TypeError):
+            narrative_service.PROMPT_CONFIG["round_context"] = {}
+        with self.assertRaises(TypeError):
+            narrative_service.PROMPT_CONFIG["round_context"]["suffix"] = ""
+
+    def test_config_parsed_once_per_file_version(self):
+        path = narrative_service.CONFIG_PATH
+        mtime_ns = os.stat(path).st_mtime_ns
+        self.assertIs(narrative_service._load_config(path, mtime_ns), narrative_service.PROMPT_CONFIG)
+        self.assertIsNot(narrative_service._load_config(path, mtime_ns + 1), narrative_service.PROMPT_CONFIG)
+
+@patch("services.narrative_service.PARSER_MODE", "legacy")
+class TestNarrativeServiceAsync(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        narrative_service._narrative_cache.clear()
+        narrative_service.semantic_cache.clear()
+
+    @patch("services.narrative_service.call_gemini_async", new_callable=AsyncMock)
+    async def test_generate_round(self, mock_call_gemini_async):
+        mock_call_gemini_async.return_value = (
+            "CONFIRMING SENTENCE: You hesitantly take the left turn.\n"
+            "SITUATION: The street twists into a labyrinth under neon glow.\n"
+            "ACTION 1: Turn left.\n"
+            "ACTION 1 CONFIRM: You boldly step into the unknown.\n"
+            "ACTION 2: Turn right.\n"
+            "ACTION 2 CONFIRM: You choose a safer path."
+        )
+        result = await generate_narrative_async(
+            stage="round",
+            narrative_context="Some context",
+            action="Test action",
+            outcome_value=5,
+            action_confirming_sentence="Action confirmed."
+        )
+        self.assertEqual(result.confirming_sentence, "You hesitantly take the left turn.")
+        self.assertEqual(len(result.choices), 2)
+        mock_call_gemini_async.assert_awaited_once()
+
+    @patch("services.narrative_service.semantic_cache.lookup", return_value=None)
+    @patch("services.narrative_service.call_gemini_async", new_callable=AsyncMock)
+    async def test_identical_requests_are_cached(self, mock_call_gemini_async, mock_semantic_lookup):
+        mock_call_gemini_async.return_value = (
+            "CONFIRMING SENTENCE: You accept your fate.\n"
+            "SITUATION: The world crumbles as you face the end."
+        )
+        first = await generate_narrative_async(stage="final", narrative_context="Context", win_or_loss="win")
+        second = await generate_narrative_async(stage="final", narrative_context="Context", win_or_loss="win")
+        self.assertEqual(first, second)
+        mock_call_gemini_async.assert_awaited_once()
+
+    @patch("services.narrative_service.semantic_cache.lookup", return_value=None)
+    @patch("services.narrative_service.call_gemini_many", new_callable=AsyncMock)
+    async def test_bulk_sends_uncached_prompts_together(self, mock_call_gemini_many, mock_semantic_lookup):
+        final = "CONFIRMING SENTENCE: You accept your fate.\nSITUATION: The world crumbles."
+        mock_call_gemini_many.return_value = [final]
+        await generate_narratives_bulk([{"stage": "final", "narrative_context": "Context", "win_or_loss": "win"}])
+
+        mock_call_gemini_many.return_value = [
+            "SITUATION: Follow the white rabbit. A mysterious alley in the rain.\n"
+            "ACTION 1: Enter the alley.\n"
+            "ACTION 1 CONFIRM: You step forward into the darkness.\n"
+            "ACTION 2: Walk away.\n"
+            "ACTION 2 CONFIRM: You decide to stay safe.",
+            final,
+        ]
+        results = await generate_narratives_bulk([
+            {"stage": "initial", "language": "Deutsch"},
+            {"stage": "final", "narrative_context": "Context", "win_or_loss": "win"},
+            {"stage": "final", "narrative_context": "Other context", "win_or_loss": "loss"},
+        ])
+        # The first final narrative is cached, so only the other two prompts are sent.
+        self.assertEqual(len(mock_call_gemini_many.await_args.args[0]), 2)
+        self.assertEqual([result.stage for result in results], ["initial", "final", "final"])
+        self.assertEqual(results[0].situation, "A mysterious alley in the rain.")
+
+class TestNarrativeStream(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        narrative_service._narrative_cache.clear()
+        narrative_service.semantic_cache.clear()
+
+    @patch("services.narrative_service.call_gemini_stream")
+    async def test_stream_final(self, mock_call_gemini_stream):
+        async def chunks(prompt):
+            for chunk in ("CONFIRMING SENTENCE: You accept", " your fate.\nSITUATION: The world ", "crumbles."):
+                yield chunk
+        mock_call_gemini_stream.side_effect = chunks
+
+        events = [event async for event in generate_narrative_stream(
+            stage="final",
+            narrative_context="Complete narrative context",
+            win_or_loss="win"
+        )]
+        self.assertEqual(events[:2], [
+            ("section", "CONFIRMING SENTENCE", "You accept your fate."),
+            ("section", "SITUATION", "The world crumbles."),
+        ])
+        self.assertEqual(events[2], ("result", FinalNarrativeResponse(
+            confirming_sentence="You accept your fate.",
+            situation="The world crumbles."
+        )))
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -1,10 +1,13 @@
-import sys
-import os
-# Add the project's root directory to sys.path
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-
+import re
 import unittest
-from utils.parser import parse_narrative_response
+from unittest.mock import patch
+from utils.parser import (
+    NarrativeFormatError,
+    SectionSplitter,
+    parse_narrative_json,
+    parse_narrative_response,
+    parse_narrative_sections,
+)
 
 class TestUnifiedParser(unittest.TestCase):
 
@@ -60,12 +63,133 @@ class TestUnifiedParser(unittest.TestCase):
         self.assertIn("situation", parsed)
         self.assertEqual(parsed["situation"], "The world crumbles as you face the end.")
 
+    @patch("utils.parser.USE_REGEX_PARSER", True)
+    def test_compiled_pattern(self):
+        response = (
+            "CONFIRMING SENTENCE: You accept your fate.\n"
+            "SITUATION: The world crumbles as you face the end."
+        )
+        pattern = re.compile(r"CONFIRMING SENTENCE:\s*(.*?)\s*\nSITUATION:\s*(.*)$", re.DOTALL | re.IGNORECASE)
+        parsed = parse_narrative_response(response, "final", pattern)
+
+        self.assertEqual(parsed["confirming_sentence"], "You accept your fate.")
+        self.assertEqual(parsed["situation"], "The world crumbles as you face the end.")
+
+    def test_multiline_sections(self):
+        response = (
+            "Here is your story.\n"
+            "CONFIRMING SENTENCE: You accept your fate.\n"
+            "SITUATION: The world crumbles\n"
+            "as you face the end."
+        )
+        parsed = parse_narrative_response(response, "final", r"unused")
+
+        self.assertEqual(parsed["confirming_sentence"], "You accept your fate.")
+        self.assertEqual(parsed["situation"], "The world crumbles\nas you face the end.")
+
+    def test_missing_section(self):
+        response = "SITUATION: Follow the white rabbit. A mysterious alley in the rain.\nACTION 1: Enter the alley."
+        with self.assertRaises(ValueError):
+            parse_narrative_response(response, "initial", r"unused")
+
+    @patch("utils.parser.USE_REGEX_PARSER", True)
+    def test_regex_parser(self):
+        response = (
+            "SITUATION: Follow the white rabbit. A mysterious alley in the rain.\n"
+            "ACTION 1: Enter the alley.\n"
+            "ACTION 1 CONFIRM: You step forward into the darkness.\n"
+            "ACTION 2: Walk away.\n"
+            "ACTION 2 CONFIRM: You decide to stay safe."
+        )
+        pattern = r"SITUATION:\s*Follow the white rabbit\.\s*(.*?)\s*\nACTION 1:\s*(.*?)\s*\nACTION 1 CONFIRM:\s*(.*?)\s*\nACTION 2:\s*(.*?)\s*\nACTION 2 CONFIRM:\s*(.*)$"
+        parsed = parse_narrative_response(response, "initial", pattern)
+
+        self.assertEqual(parsed["situation"], "A mysterious alley in the rain.")
+        self.assertEqual(parsed["choices"][1]["confirming_sentence"], "You decide to stay safe.")
+        with self.assertRaises(ValueError):
+            parse_narrative_response("This response does not match the expected format.", "initial", pattern)
+
     def test_invalid_response(self):
         response = "This response does not match the expected format."
         pattern = r"SITUATION:\s*Follow the white rabbit\.\s*(.*?)\s*\nACTION 1:\s*(.*?)\s*\nACTION 1 CONFIRM:\s*(.*?)\s*\nACTION 2:\s*(.*?)\s*\nACTION 2 CONFIRM:\s*(.*)$"
         with self.assertRaises(ValueError):
             parse_narrative_response(response, "initial", pattern)
 
+    def test_invalid_stage(self):
+        response = "CONFIRMING SENTENCE: You accept your fate.\nSITUATION: The world crumbles."
+        with self.assertRaises(ValueError):
+            parse_narrative_response(response, "epilogue", r"(.*)")
+
+
+class TestSectionsParser(unittest.TestCase):
+
+    def test_sections_from_splitter(self):
+        splitter = SectionSplitter()
+        sections = dict(
+            splitter.feed("SITUATION: Follow the white rabbit. A mysterious alley.\nACTION 1: Enter the alley.\n")
+            + splitter.feed("ACTION 1 CONFIRM: You step forward.\nACTION 2: Walk away.\nACTION 2 CONFIRM: You stay safe.")
+            + splitter.close()
+        )
+        parsed = parse_narrative_sections(sections, "initial")
+
+        self.assertEqual(parsed["situation"], "A mysterious alley.")
+        self.assertEqual(parsed["choices"][1]["choice_description"], "Walk away.")
+        self.assertEqual(parsed["choices"][1]["outcome"], "negative")
+
+    def test_missing_section(self):
+        with self.assertRaises(NarrativeFormatError):
+            parse_narrative_sections({"CONFIRMING SENTENCE": "You accept your fate."}, "final")
+
+
+class TestJsonParser(unittest.TestCase):
+
+    def test_initial_valid(self):
+        response = (
+            '{"situation": "Follow the white rabbit. A mysterious alley in the rain.", '
+            '"action_1": "Enter the alley.", "action_1_confirm": "You step forward into the darkness.", '
+            '"action_2": "Walk away.", "action_2_confirm": "You decide to stay safe."}'
+        )
+        parsed = parse_narrative_json(response, "initial")
+
+        self.assertEqual(parsed["situation"], "A mysterious alley in the rain.")
+        self.assertEqual(parsed["choices"][0], {
+            "id": 1,
+            "choice_description": "Enter the alley.",
+            "confirming_sentence": "You step forward into the darkness.",
+            "outcome": "positive"
+        })
+        self.assertEqual(parsed["choices"][1]["id"], 2)
+
+    def test_final_valid(self):
+        response = '{"confirming_sentence": " You accept your fate. ", "situation": "The world crumbles."}'
+        parsed = parse_narrative_json(response, "final")
+
+        self.assertEqual(parsed, {"confirming_sentence": "You accept your fate.", "situation": "The world crumbles."})
+
+    def test_invalid_response(self):
+        with self.assertRaises(NarrativeFormatError):
+            parse_narrative_json("CONFIRMING SENTENCE: You accept your fate.", "final")
+        with self.assertRaises(NarrativeFormatError):
+            parse_narrative_json('{"situation": "The world crumbles."}', "final")
+
+
+class TestSectionSplitter(unittest.TestCase):
+
+    def test_sections_complete_when_next_label_arrives(self):
+        splitter = SectionSplitter()
+        self.assertEqual(splitter.feed("CONFIRMING SENTENCE: You accept"), [])
+        self.assertEqual(splitter.feed(" your fate.\nSITUATION: The world"), [])
+        self.assertEqual(
+            splitter.feed(" crumbles.\nIt is over.\n"),
+            [("CONFIRMING SENTENCE", "You accept your fate.")]
+        )
+        self.assertEqual(splitter.close(), [("SITUATION", "The world crumbles.\nIt is over.")])
+
+    def test_labels_are_normalized(self):
+        splitter = SectionSplitter()
+        sections = splitter.feed("action 1 confirm: Yes.\nAction 2:  No.\n") + splitter.close()
+        self.assertEqual(sections, [("ACTION 1 CONFIRM", "Yes."), ("ACTION 2", "No.")])
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
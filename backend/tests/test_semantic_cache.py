@@ -0,0 +1,50 @@
+import unittest
+from unittest.mock import patch
+from utils import semantic_cache
+
+# Fixed, already normalized embeddings standing in for the sentence-transformers model.
+EMBEDDINGS = {
+    "prompt a": [1.0, 0.0],
+    "prompt a, reworded": [0.99, 0.141],
+    "prompt b": [0.0, 1.0],
+}
+
+@unittest.skipIf(semantic_cache.np is None, "numpy is not installed")
+class TestSemanticCache(unittest.TestCase):
+
+    def setUp(self):
+        semantic_cache.clear()
+        patcher = patch("utils.semantic_cache._embed", lambda text: semantic_cache.np.array(EMBEDDINGS[text]))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_similar_prompt_hits(self):
+        semantic_cache.insert("prompt a", "round", {"situation": "A"})
+        self.assertEqual(semantic_cache.lookup("prompt a, reworded", "round"), {"situation": "A"})
+
+    def test_dissimilar_prompt_misses(self):
+        semantic_cache.insert("prompt a", "round", {"situation": "A"})
+        self.assertIsNone(semantic_cache.lookup("prompt b", "round"))
+
+    def test_partitions_are_separate(self):
+        semantic_cache.insert("prompt a", ("round", "Deutsch", 1), {"situation": "A"})
+        self.assertIsNone(semantic_cache.lookup("prompt a", ("round", "Deutsch", -1)))
+        self.assertIsNone(semantic_cache.lookup("prompt a", "final"))
+
+    @patch("utils.semantic_cache.SEMANTIC_CACHE_MAXSIZE", 1)
+    def test_evicts_least_recently_used(self):
+        semantic_cache.insert("prompt a", "round", {"situation": "A"})
+        semantic_cache.insert("prompt b", "round", {"situation": "B"})
+        self.assertIsNone(semantic_cache.lookup("prompt a", "round"))
+        self.assertEqual(semantic_cache.lookup("prompt b", "round"), {"situation": "B"})
+
+    @patch("utils.semantic_cache.SEMANTIC_CACHE_MAXSIZE", 1)
+    def test_size_is_bounded_across_partitions(self):
+        semantic_cache.insert("prompt a", ("round", "Deutsch", 1), {"situation": "A"})
+        semantic_cache.insert("prompt a", ("round", "Deutsch", 2), {"situation": "B"})
+        self.assertIsNone(semantic_cache.lookup("prompt a", ("round", "Deutsch", 1)))
+        self.assertEqual(semantic_cache.lookup("prompt a", ("round", "Deutsch", 2)), {"situation": "B"})
+        self.assertEqual(len(semantic_cache._entries), 1)
+
+if __name__ == '__main__':
+    unittest.main()
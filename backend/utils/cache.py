@@ -0,0 +1,125 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+class TTLCache:
+    """
+    Small thread-safe LRU cache whose entries expire after a fixed time-to-live.
+
+    Parameters:
+        maxsize (int): Maximum number of entries kept; the least recently used entry is evicted first.
+        ttl (float): Lifetime of an entry in seconds.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Returns the cached value for key, or default if it is missing or expired.
+        """
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value) -> None:
+        """
+        Stores value under key, evicting the least recently used entry when full.
+        """
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls that share a key into a single execution.
+
+    The first caller for a key runs the function; callers arriving while it is still
+    running wait for and receive the same result (or exception). Sync callers (do) and
+    async callers (do_async) share the same in-flight calls. A cancelled async follower
+    only stops waiting itself; if the async leader is cancelled, its followers get a
+    RuntimeError.
+    """
+
+    def __init__(self):
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def _join(self, key) -> tuple:
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+                # A running future cannot be cancelled, so one waiter giving up cannot
+                # cancel the call for everyone else.
+                future.set_running_or_notify_cancel()
+        return future, leader
+
+    def do(self, key, fn):
+        """
+        Runs fn() unless a call for key is already in flight, and returns its result.
+        """
+        future, leader = self._join(key)
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    async def do_async(self, key, fn):
+        """
+        Awaits fn() unless a call for key is already in flight, and returns its result.
+        """
+        future, leader = self._join(key)
+        if not leader:
+            # Shielded, so a cancelled follower stops waiting without touching the shared future.
+            return await asyncio.shield(asyncio.wrap_future(future))
+
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            # Only the leader was cancelled; its followers get an ordinary error instead.
+            future.set_exception(RuntimeError(f"In-flight call for {key!r} was cancelled"))
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._inflight[key]
@@ -1,14 +1,134 @@
+import os
 import re
+import sys
+from functools import lru_cache
+from typing import Callable, Union
+from pydantic import ValidationError
+from models.narrative import InitialNarrativeOutput, RoundNarrativeOutput, FinalNarrativeOutput
 
 
-def parse_narrative_response(response: str, stage: str, pattern: str) -> dict:
+# The line-based parser is the default; set USE_REGEX_PARSER=yes to match the config regex instead.
+USE_REGEX_PARSER = os.environ.get("USE_REGEX_PARSER", "no").lower() in ("yes", "true", "1")
+
+# Section labels making up each stage's response, in capture-group order.
+STAGE_SECTIONS = {
+    "initial": ("SITUATION", "ACTION 1", "ACTION 1 CONFIRM", "ACTION 2", "ACTION 2 CONFIRM"),
+    "round": ("CONFIRMING SENTENCE", "SITUATION", "ACTION 1", "ACTION 1 CONFIRM", "ACTION 2", "ACTION 2 CONFIRM"),
+    "final": ("CONFIRMING SENTENCE", "SITUATION"),
+}
+
+# Structured-output model Gemini fills in for each stage (see parse_narrative_json); its
+# fields are declared in the order of the stage's sections.
+STAGE_OUTPUT_MODELS = {
+    "initial": InitialNarrativeOutput,
+    "round": RoundNarrativeOutput,
+    "final": FinalNarrativeOutput,
+}
+
+# Output keys of each stage's parsed narrative and the (0-based) group each is read from;
+# "choices" is built from the groups of ACTION 1, ACTION 1 CONFIRM, ACTION 2 and ACTION 2 CONFIRM.
+_SCHEMA = {
+    "initial": (("situation", 0), ("choices", (1, 2, 3, 4))),
+    "round": (("confirming_sentence", 0), ("situation", 1), ("choices", (2, 3, 4, 5))),
+    "final": (("confirming_sentence", 0), ("situation", 1)),
+}
+
+# Keys and outcome values of every parsed choice, interned once and shared by all parsed narratives.
+_CHOICE_KEYS = tuple(sys.intern(key) for key in ("id", "choice_description", "confirming_sentence", "outcome"))
+_POSITIVE, _NEGATIVE = sys.intern("positive"), sys.intern("negative")
+
+# The "initial" situation starts with this fixed phrase, which is not part of the narrative.
+WHITE_RABBIT = re.compile(r"^Follow the white rabbit\.\s*", re.IGNORECASE)
+
+
+class NarrativeFormatError(ValueError):
+    """
+    Raised when a Gemini response does not match the expected narrative format.
+    """
+
+
+@lru_cache(maxsize=16)
+def compile_pattern(pattern: str) -> re.Pattern:
+    """
+    Compiles a narrative regex pattern once, with the flags the parser relies on.
+    """
+    return re.compile(pattern, re.DOTALL | re.IGNORECASE)
+
+
+# A line that starts one of the labelled sections of a narrative response, e.g. "ACTION 1: ...".
+SECTION_LINE = re.compile(
+    r"^\s*(CONFIRMING SENTENCE|SITUATION|ACTION [12] CONFIRM|ACTION [12])\s*:\s*(.*)$",
+    re.IGNORECASE,
+)
+
+
+class SectionSplitter:
+    """
+    Incrementally splits a narrative response into its labelled sections.
+
+    Text can be fed in arbitrary chunks (e.g. as it streams in from Gemini). A section is
+    returned as soon as it is complete, i.e. once the next section's label line arrives;
+    the last section is returned by close(). Lines that do not start a new section are
+    treated as continuation lines of the current one.
     """
-    Unified parser for narrative responses from the Gemini API.
+
+    def __init__(self):
+        self._buffer = ""
+        self._label = None
+        self._lines = []
+
+    def feed(self, text: str) -> list:
+        """
+        Adds text and returns the (label, value) pairs of the sections it completed.
+        """
+        self._buffer += text
+        *lines, self._buffer = self._buffer.split("\n")
+        completed = []
+        for line in lines:
+            self._add_line(line, completed)
+        return completed
+
+    def close(self) -> list:
+        """
+        Flushes any buffered text and returns the remaining (label, value) pairs.
+        """
+        completed = []
+        self._add_line(self._buffer, completed)
+        self._buffer = ""
+        if self._label is not None:
+            completed.append(self._section())
+            self._label = None
+        return completed
+
+    def _add_line(self, line: str, completed: list) -> None:
+        match = SECTION_LINE.match(line)
+        if match:
+            if self._label is not None:
+                completed.append(self._section())
+            self._label = " ".join(match.group(1).upper().split())
+            self._lines = [match.group(2)]
+        elif self._label is not None:
+            self._lines.append(line)
+
+    def _section(self) -> tuple:
+        return self._label, "\n".join(self._lines).strip()
+
+
+def parse_narrative_response(response: str, stage: str, pattern: Union[str, re.Pattern]) -> dict:
+    """
+    Unified parser for text narrative responses from the Gemini API (PARSER_MODE=legacy
+    and streaming; structured JSON responses go through parse_narrative_json).
+
+    By default the response is read in a single pass over its lines: every line that
+    starts with a section label ("SITUATION:", "ACTION 1:", ...) opens that section and
+    other lines continue the current one. With USE_REGEX_PARSER=yes the stage's config
+    regex is matched against the whole response instead.
 
     Parameters:
         response (str): The raw API response.
         stage (str): One of "initial", "round", or "final".
-        pattern (str): The regex pattern corresponding to the prompt template as defined in the config JSON.
+        pattern (str | re.Pattern): Only used with USE_REGEX_PARSER. The regex pattern corresponding to the prompt template as defined in the
+                       config JSON, either as a string or already compiled with re.DOTALL | re.IGNORECASE.
                        The pattern must contain capturing groups in the following order:
 
             For "initial":
@@ -34,64 +154,117 @@ def parse_narrative_response(response: str, stage: str, pattern: str) -> dict:
         dict: Parsed narrative data following the predefined format.
 
     Raises:
-        ValueError: If the response does not match the expected format.
+        NarrativeFormatError: If the response does not match the expected format.
+        ValueError: If the stage is invalid.
     """
-    match = re.search(pattern, response, re.DOTALL | re.IGNORECASE)
-    if not match:
-        raise ValueError(f"{stage.capitalize()} narrative response format invalid. Received response:\n{response}")
+    schema = _SCHEMA.get(stage)
+    if schema is None:
+        raise ValueError("Invalid stage provided to parser. Use 'initial', 'round', or 'final'.")
 
-    if stage == "initial":
-        situation = match.group(1).strip()
-        action1 = match.group(2).strip()
-        action1_confirm = match.group(3).strip()
-        action2 = match.group(4).strip()
-        action2_confirm = match.group(5).strip()
-        parsed = {
-            "situation": situation,
-            "choices": [
-                {"id": 1, "choice_description": action1, "confirming_sentence": action1_confirm, "outcome": "positive"},
-                {"id": 2, "choice_description": action2, "confirming_sentence": action2_confirm, "outcome": "negative"}
-            ]
-        }
-    elif stage == "round":
-        confirming_sentence = match.group(1).strip()
-        situation = match.group(2).strip()
-        action1 = match.group(3).strip()
-        action1_confirm = match.group(4).strip()
-        action2 = match.group(5).strip()
-        action2_confirm = match.group(6).strip()
-        parsed = {
-            "confirming_sentence": confirming_sentence,
-            "situation": situation,
-            "choices": [
-                {"id": 1, "choice_description": action1, "confirming_sentence": action1_confirm, "outcome": "positive"},
-                {"id": 2, "choice_description": action2, "confirming_sentence": action2_confirm, "outcome": "negative"}
-            ]
-        }
-    elif stage == "final":
-        confirming_sentence = match.group(1).strip()
-        situation = match.group(2).strip()
-        parsed = {
-            "confirming_sentence": confirming_sentence,
-            "situation": situation
-        }
+    if USE_REGEX_PARSER:
+        groups = _regex_groups(response, stage, pattern)
     else:
+        groups = _section_groups(response, stage)
+
+    return _assemble(groups, schema)
+
+
+def parse_narrative_sections(sections: dict, stage: str) -> dict:
+    """
+    Builds the parsed narrative from a text response that has already been split into
+    sections, e.g. by a SectionSplitter while the response streamed in, so the text is
+    not parsed a second time.
+
+    Parameters:
+        sections (dict): Section label (as returned by SectionSplitter) -> section text.
+        stage (str): One of "initial", "round", or "final".
+
+    Returns:
+        dict: Parsed narrative data following the predefined format.
+
+    Raises:
+        NarrativeFormatError: If one of the stage's sections is missing.
+        ValueError: If the stage is invalid.
+    """
+    schema = _SCHEMA.get(stage)
+    if schema is None:
         raise ValueError("Invalid stage provided to parser. Use 'initial', 'round', or 'final'.")
 
-    # Additional assertions on parsed output.
-    if stage in ("initial", "round"):
-        assert isinstance(parsed, dict), "Parsed output should be a dictionary."
-        assert "situation" in parsed, "Parsed output missing 'situation'"
-        assert "choices" in parsed, "Parsed output missing 'choices'"
-        assert isinstance(parsed["choices"], list) and len(parsed["choices"]) == 2, "There must be exactly two choices"
-        for choice in parsed["choices"]:
-            assert "id" in choice, "Choice missing 'id'"
-            assert "choice_description" in choice, "Choice missing 'choice_description'"
-            assert "confirming_sentence" in choice, "Choice missing 'confirming_sentence'"
-            assert "outcome" in choice, "Choice missing 'outcome'"
-    elif stage == "final":
-        assert isinstance(parsed, dict), "Parsed output should be a dictionary."
-        assert "confirming_sentence" in parsed, "Parsed output missing 'confirming_sentence'"
-        assert "situation" in parsed, "Parsed output missing 'situation'"
-
-    return parsed
\ No newline at end of file
+    # The sections are only joined back into text for the error message of a malformed response.
+    received = lambda: "\n".join(f"{label}: {text}" for label, text in sections.items())
+    return _assemble(_section_values(sections, stage, received), schema)
+
+
+def parse_narrative_json(response: str, stage: str) -> dict:
+    """
+    Parser for structured (JSON) narrative responses from the Gemini API.
+
+    The response is validated against the stage's output model (STAGE_OUTPUT_MODELS) in
+    a single pass by pydantic-core; its fields then fill the narrative exactly like the
+    sections of a text response.
+
+    Parameters:
+        response (str): The raw API response, a JSON object.
+        stage (str): One of "initial", "round", or "final".
+
+    Returns:
+        dict: Parsed narrative data following the predefined format.
+
+    Raises:
+        NarrativeFormatError: If the response is not a JSON object with the stage's fields.
+        ValueError: If the stage is invalid.
+    """
+    schema = _SCHEMA.get(stage)
+    if schema is None:
+        raise ValueError("Invalid stage provided to parser. Use 'initial', 'round', or 'final'.")
+
+    try:
+        output = STAGE_OUTPUT_MODELS[stage].model_validate_json(response)
+    except ValidationError:
+        raise NarrativeFormatError(f"{stage.capitalize()} narrative response format invalid. Received response:\n{response}")
+
+    groups = [value.strip() for value in output.model_dump().values()]
+    if stage == "initial":
+        groups[0] = WHITE_RABBIT.sub("", groups[0])
+    return _assemble(groups, schema)
+
+
+def _assemble(groups: list, schema: tuple) -> dict:
+    parsed = {}
+    for key, index in schema:
+        parsed[key] = _choices(groups, *index) if isinstance(index, tuple) else groups[index]
+    return parsed
+
+
+def _choices(groups: list, action1: int, action1_confirm: int, action2: int, action2_confirm: int) -> list:
+    return [
+        dict(zip(_CHOICE_KEYS, (1, groups[action1], groups[action1_confirm], _POSITIVE))),
+        dict(zip(_CHOICE_KEYS, (2, groups[action2], groups[action2_confirm], _NEGATIVE)))
+    ]
+
+
+def _section_groups(response: str, stage: str) -> list:
+    splitter = SectionSplitter()
+    return _section_values(dict(splitter.feed(response) + splitter.close()), stage, lambda: response)
+
+
+def _section_values(sections: dict, stage: str, received: Callable[[], str]) -> list:
+    try:
+        groups = [sections[label] for label in STAGE_SECTIONS[stage]]
+    except KeyError:
+        raise NarrativeFormatError(f"{stage.capitalize()} narrative response format invalid. Received response:\n{received()}")
+
+    if stage == "initial":
+        groups[0] = WHITE_RABBIT.sub("", groups[0])
+    return groups
+
+
+def _regex_groups(response: str, stage: str, pattern: Union[str, re.Pattern]) -> list:
+    if isinstance(pattern, str):
+        pattern = compile_pattern(pattern)
+    match = pattern.search(response)
+    if not match:
+        raise NarrativeFormatError(f"{stage.capitalize()} narrative response format invalid. Received response:\n{response}")
+
+    # Read all capturing groups in one call instead of one match.group() call per field.
+    return [group.strip() for group in match.groups()]
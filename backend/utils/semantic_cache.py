@@ -0,0 +1,132 @@
+"""
+Purpose:
+    Embedding-similarity cache for parsed narratives. A request whose text is a
+    near-duplicate of an earlier one in the same partition (cosine similarity at or above
+    SEMANTIC_CACHE_THRESHOLD) is answered with the earlier parsed narrative.
+
+Inputs:
+    - text (str): The request text to embed, e.g. the player's action and the latest part
+      of the narrative (see narrative_service.semantic_cache_key).
+    - partition (hashable): The fields that must match exactly, e.g. (stage, language,
+      outcome value); each partition has its own index so texts never match across them.
+
+Outputs:
+    - lookup() returns the cached parsed narrative or None.
+
+Guardrails:
+    - Optional: only active when the sentence-transformers package (and numpy) is
+      installed. Without it lookup() always misses and insert() does nothing.
+    - The embedding model (all-MiniLM-L6-v2, 384 dimensions) is loaded on first use. It
+      reads at most 256 tokens, so texts should be kept short.
+    - The cache keeps at most SEMANTIC_CACHE_MAXSIZE entries across all partitions,
+      evicting the least recently used one, so partitions made from request fields
+      cannot grow it without bound.
+"""
+import os
+import logging
+import threading
+import importlib.util
+from collections import OrderedDict
+from functools import lru_cache
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_MAXSIZE = int(os.environ.get("SEMANTIC_CACHE_MAXSIZE", "512"))
+
+# Whether the embedding model can be loaded at all. Checked without importing
+# sentence-transformers, so callers can skip the cache cheaply when it is missing.
+AVAILABLE = np is not None and importlib.util.find_spec("sentence_transformers") is not None
+
+# partition -> {text: (L2-normalized embedding, parsed narrative)}
+_entries = {}
+# (partition, text) of every entry, least recently used first.
+_order = OrderedDict()
+_lock = threading.Lock()
+
+
+@lru_cache(maxsize=1)
+def _get_model():
+    if np is None:
+        return None
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError:
+        logger.info("sentence-transformers is not installed; semantic cache disabled")
+        return None
+    return SentenceTransformer(EMBEDDING_MODEL)
+
+
+def warm_up() -> None:
+    """
+    Loads the embedding model now instead of on the first lookup or insert.
+    """
+    _get_model()
+
+
+def _embed(text: str):
+    """
+    Returns the L2-normalized embedding of a text, or None if the cache is unavailable.
+    """
+    model = _get_model()
+    if model is None:
+        return None
+    return model.encode(text, normalize_embeddings=True)
+
+
+def lookup(text: str, partition):
+    """
+    Returns the cached parsed narrative of the most similar earlier text in the
+    partition, or None if no text is similar enough.
+    """
+    if partition not in _entries:
+        return None
+    vector = _embed(text)
+    if vector is None:
+        return None
+
+    with _lock:
+        entries = _entries.get(partition)
+        if not entries:
+            return None
+        keys = list(entries)
+        matrix = np.stack([entries[key][0] for key in keys])
+        # Embeddings are normalized, so the dot product is the cosine similarity.
+        scores = matrix @ vector
+        best = int(scores.argmax())
+        if scores[best] < SEMANTIC_CACHE_THRESHOLD:
+            return None
+        _order.move_to_end((partition, keys[best]))
+        return entries[keys[best]][1]
+
+
+def insert(text: str, partition, parsed_data) -> None:
+    """
+    Stores a parsed narrative under the text's embedding in the partition.
+    """
+    vector = _embed(text)
+    if vector is None:
+        return
+
+    with _lock:
+        _entries.setdefault(partition, {})[text] = (vector, parsed_data)
+        _order[(partition, text)] = None
+        _order.move_to_end((partition, text))
+        while len(_order) > SEMANTIC_CACHE_MAXSIZE:
+            (oldest_partition, oldest_text), _ = _order.popitem(last=False)
+            entries = _entries[oldest_partition]
+            del entries[oldest_text]
+            if not entries:
+                del _entries[oldest_partition]
+
+
+def clear() -> None:
+    with _lock:
+        _entries.clear()
+        _order.clear()